@@ -6,6 +6,7 @@ file for monthly end-to-end tests. The steps are:
     (2) Write the DAGMaker.rc file based on the input exposures.
 """
 
+import argparse
 from dataclasses import dataclass
 import datetime
 import logging
@@ -15,6 +16,7 @@ import sys
 import pandas as pd
 
 import utils
+import workspace
 import more_itertools as mit
 import numpy as np
 import psycopg2
@@ -186,7 +188,7 @@ MAX_NITE={time_info.max_nite}
 SKIP_INCOMPLETE_SE=false
 DO_HEADER_CHECK=1
 """
-    with open(outfile, 'w+') as f:
+    with workspace.atomic_open(outfile) as f:
         f.write(dag_info)
 
 ### Helper functions.
@@ -244,13 +246,20 @@ def _get_time_boundaries(exposure_df: pd.DataFrame) -> TimeInfo:
 
 ### Runtime behavior.
 if __name__ == "__main__":
-    # Setup logging.
-    log_file = "configure_dag.log"  # TODO(@Rob): decide on default filename.
-    utils._setup_logging(log_file)
+    parser = argparse.ArgumentParser()
+    workspace.add_arguments(parser)
+    args = parser.parse_args()
 
     # Choose season.
     season = _get_season(datetime.date.today())
 
+    ws = workspace.from_args(args, name=str(season))
+    ws.acquire()
+
+    # Setup logging.
+    log_file = ws.file("configure_dag.log")  # TODO(@Rob): decide on default filename.
+    utils._setup_logging(log_file)
+
     # Choose pointing.
     ra = random.uniform(0.0, 360.0 - 1.e-5)
     dec = random.uniform(-90.0, 30.0)  # +30 is the upper limit for DECam.
@@ -259,15 +268,13 @@ if __name__ == "__main__":
 
     # Get exposures.
     exposure_df = get_exposure_info(ra, dec)
-    exposure_df.to_csv(str(season)+'exposures.csv', index=False)
-    np.savetxt(str(season)+'exposures.list',exposure_df['expnum'].values[exposure_df['SEARCH'].values], fmt='%d')
+    ws.write(str(season)+'exposures.csv', exposure_df.to_csv(index=False))
+    with workspace.atomic_open(ws.file(str(season)+'exposures.list')) as f:
+        np.savetxt(f,exposure_df['expnum'].values[exposure_df['SEARCH'].values], fmt='%d')
     logging.info("get_exposure_info output:")
     logging.info(exposure_df)
 
     # Create DAGMaker rc.
-    write_dag_rc(exposure_df, season)
+    write_dag_rc(exposure_df, season, ws.file('dagmaker.rc'))
 
     logging.debug("Program Completed.")
-
-
-
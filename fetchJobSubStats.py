@@ -1,4 +1,5 @@
 import glob
+import os
 import pickle
 import pandas as pd
 import numpy as np
@@ -6,36 +7,17 @@ import configparser
 import argparse
 import subprocess
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--season', type=str)
-parser.add_argument('--exp_list', type=str)
-args = parser.parse_args()
+import results_store
+import track_jobs
+import triage_failures
+import workspace
 
-season = str(args.season)
 
-cmd = ['python get_full_exp_info.py --exp_list ' + args.exp_list]
-process = subprocess.Popen(cmd, bufsize=1, shell=True, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-stdout, stderr = process.communicate()
+def count_failures(files_finished, files_failed):
+    """Count the finished CCDs that failed on each step.
 
-exp_details = pd.read_csv('exp_list_full.list')
-exps = list(exp_details['exposure'])
-nites = list(exp_details['nite'])
-
-dir_prefix_exp = '/pnfs/des/persistent/gw/exp/'
-dir_prefix_fp = '/pnfs/des/persistent/gw/forcephoto/images/dp'
-
-stats_dict = {}
-finished = 0
-
-for exp, nite in zip(exps, nites):
-
-    exp = str(exp)
-    nite = str(nite)
-
-    print(dir_prefix_exp + nite + '/' + exp + '/dp' + season)
-    files_finished = glob.glob(dir_prefix_exp + nite + '/' + exp + '/dp' + season + '/*_*/*.tar.gz')
-    files_filled = glob.glob(dir_prefix_exp + nite + '/' + exp + '/dp' + season + '/*_*/stamps*')
-    files_failed = glob.glob(dir_prefix_exp + nite + '/' + exp + '/dp' + season + '/*_*/*.FAIL')
+    A CCD counts against the step named by the prefix of its first .FAIL file.
+    """
     finished_ccds = [f.split('/')[-2] for f in files_finished]
     failed_ccds = []
     fail_types = []
@@ -44,55 +26,144 @@ for exp, nite in zip(exps, nites):
         failed_ccds.append(f.split('/')[-2])
         fail_types.append(f.split('/')[-1])
 
-    dict_fails = []
+    run = []
 
-    if len(files_finished) == 0 and len(files_failed) == 0:
-        print('Nothing has finished for ' + exp + '.')
-    
-    elif len(files_failed) == 0 and len(files_finished) > 0:
-        print(str(len(finished_ccds)) + ' ccds have finished, and none have failed.')
-        #for finished_ccd in finished_ccds:
-        #    print(finished_ccd + ' finished and did not fail.')
+    for ccd in finished_ccds:
+        if ccd in failed_ccds:
+            run.append(fail_types[failed_ccds.index(ccd)].split('.')[0])
+
+    exp_failures = {}
+    for run_num in np.unique(run):
+        count = 0
+        for r in run:
+            if r == run_num:
+                count += 1
+        exp_failures[run_num] = count
+
+    return exp_failures
+
+
+def get_wall_time(run_dir='.'):
+    """Get the time from the first submission of a run to the end of its jobs.
+
+    The run starts when the oldest jobsub_*.out file in the run directory was
+    written, and ends at the last transition in job_timeline.csv.
+
+    Returns:
+      The wall time in seconds, or None if the jobs of the run were not tracked.
+    """
+    timeline = track_jobs.read_timeline(os.path.join(run_dir, 'job_timeline.csv'))
+    if len(timeline) == 0:
+        return None
+    submitted = [os.path.getmtime(f) for f in glob.glob(os.path.join(run_dir, 'jobsub_*.out'))]
+    start = min(submitted + list(timeline['time']))
+    return float(timeline['time'].max() - start)
+
+
+def store_results(store, season, run_id, results, release=None, run_dir='.'):
+    """Append the results of a run, with its wall time, to the results store."""
+    wall_time = get_wall_time(run_dir)
+    if wall_time is None:
+        print('The jobs in ' + run_dir + ' were not tracked, so the wall time of the run is unknown.')
+    results_store.append_run(store, int(season), run_id, results, release, wall_time)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--season', type=str)
+    parser.add_argument('--exp_list', type=str)
+    parser.add_argument('--run_id', type=str, default=None, help="defaults to the name of the run directory.")
+    parser.add_argument('--release', type=str, default=None, help="pipeline release being tested.")
+    parser.add_argument('--store', type=str, default='results.db')
+    parser.add_argument('--store_results', action='store_true', help="append the final results of the run to --store.")
+    parser.add_argument('--triage', action='store_true', help="classify the causes of the .FAIL files.")
+    workspace.add_arguments(parser)
+    args = parser.parse_args()
+    ws = workspace.from_args(args, name=str(args.season))
 
-    else:
-        run = []
+    season = str(args.season)
+
+    cmd = ['python get_full_exp_info.py --exp_list ' + args.exp_list + ' --run_dir ' + ws.path]
+    process = subprocess.Popen(cmd, bufsize=1, shell=True, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+
+    exp_details = pd.read_csv(ws.file('exp_list_full.list'))
+    exps = list(exp_details['exposure'])
+    nites = list(exp_details['nite'])
+
+    dir_prefix_exp = '/pnfs/des/persistent/gw/exp/'
+    dir_prefix_fp = '/pnfs/des/persistent/gw/forcephoto/images/dp'
+
+    stats_dict = {}
+    finished = 0
+    results = []
+    all_failed = []
+
+    for exp, nite in zip(exps, nites):
+
+        exp = str(exp)
+        nite = str(nite)
+
+        print(dir_prefix_exp + nite + '/' + exp + '/dp' + season)
+        files_finished = glob.glob(dir_prefix_exp + nite + '/' + exp + '/dp' + season + '/*_*/*.tar.gz')
+        files_filled = glob.glob(dir_prefix_exp + nite + '/' + exp + '/dp' + season + '/*_*/stamps*')
+        files_failed = glob.glob(dir_prefix_exp + nite + '/' + exp + '/dp' + season + '/*_*/*.FAIL')
+        all_failed += files_failed
+        finished_ccds = [f.split('/')[-2] for f in files_finished]
+
+        dict_fails = []
+        exp_failures = {}
+
+        if len(files_finished) == 0 and len(files_failed) == 0:
+            print('Nothing has finished for ' + exp + '.')
     
-        for ccd in finished_ccds:
-            if ccd in failed_ccds:
-                run.append(fail_types[failed_ccds.index(ccd)].split('.')[0])
-                
-        for run_num in np.unique(run):
-            count = 0
-            for r in run:
-                if r == run_num:
-                    count += 1
-            print(run_num + ': {:0.2f}'.format(float(count)/float(len(files_finished))*100) + '% of CCDs failed on this step. (' + str(count) + ' out of ' + str(len(files_finished))+').')
+        elif len(files_failed) == 0 and len(files_finished) > 0:
+            print(str(len(finished_ccds)) + ' ccds have finished, and none have failed.')
+            #for finished_ccd in finished_ccds:
+            #    print(finished_ccd + ' finished and did not fail.')
+
+        else:
+            exp_failures = count_failures(files_finished, files_failed)
+
+            for run_num, count in exp_failures.items():
+                print(run_num + ': {:0.2f}'.format(float(count)/float(len(files_finished))*100) + '% of CCDs failed on this step. (' + str(count) + ' out of ' + str(len(files_finished))+').')
             
-            try:
-                stats_dict[run_num] += count
-            except KeyError:
-                stats_dict[run_num] = count
+                try:
+                    stats_dict[run_num] += count
+                except KeyError:
+                    stats_dict[run_num] = count
 
-        finished += len(files_finished)
+            finished += len(files_finished)
         
-    print(dir_prefix_fp + season + '/' + nite + '/' + exp + '/')
-    files_fits = glob.glob(dir_prefix_fp + season + '/' + nite + '/' + exp + '/*.fits')
-    files_psf = glob.glob(dir_prefix_fp + season + '/' + nite + '/' + exp + '/*.psf')
+        print(dir_prefix_fp + season + '/' + nite + '/' + exp + '/')
+        files_fits = glob.glob(dir_prefix_fp + season + '/' + nite + '/' + exp + '/*.fits')
+        files_psf = glob.glob(dir_prefix_fp + season + '/' + nite + '/' + exp + '/*.psf')
     
-    all_forcephot_present = False
-
-    if len(files_fits) > 0 and len(files_psf) > 0:
-        print('ForcePhoto outputs for '+ exp + ' are present.')
-        all_forcephot_present = True
-    else:
-        if len(files_fits) == 0 and len(files_psf) == 0:
-            print('Missing all ForcePhoto outputs for ' + exp + '.')
-        elif len(files_fits) == 0 and len(files_psf) > 0:
-            print('Missing the fits output for ' + exp + '.')
-        else:
-            print('Missing the psf output for ' + exp +'.')
-
-    stats_dict['Finished'] = finished
+        all_forcephot_present = False
 
-with open('fetchJobSubStatsDict.pkl', 'wb') as f:
-    pickle.dump(stats_dict, f)
+        if len(files_fits) > 0 and len(files_psf) > 0:
+            print('ForcePhoto outputs for '+ exp + ' are present.')
+            all_forcephot_present = True
+        else:
+            if len(files_fits) == 0 and len(files_psf) == 0:
+                print('Missing all ForcePhoto outputs for ' + exp + '.')
+            elif len(files_fits) == 0 and len(files_psf) > 0:
+                print('Missing the fits output for ' + exp + '.')
+            else:
+                print('Missing the psf output for ' + exp +'.')
+
+        stats_dict['Finished'] = finished
+        results.append({'exposure': exp, 'nite': nite, 'finished': len(files_finished),
+                        'forcephoto': all_forcephot_present, 'failures': exp_failures})
+
+    ws.write('fetchJobSubStatsDict.pkl', pickle.dumps(stats_dict), 'wb')
+
+    if args.store_results:
+        run_id = args.run_id or os.path.basename(ws.path)
+        store_results(args.store, season, run_id, results, args.release, ws.path)
+
+    if args.triage:
+        counts, example_paths = triage_failures.summarize(triage_failures.triage(all_failed, run_dir=ws.path))
+        print(counts.to_string())
+        for cause, paths in example_paths.items():
+            print(cause + ': ' + ', '.join(paths))
@@ -3,9 +3,13 @@ import psycopg2
 import numpy as np
 import argparse
 
+import workspace
+
 parser = argparse.ArgumentParser()
 parser.add_argument('--exp_list', type=str)
+workspace.add_arguments(parser)
 args = parser.parse_args()
+ws = workspace.from_args(args)
 
 df = pd.DataFrame(columns=['exposure', 'nite', 'radeg', 'decdeg'])
 
@@ -32,4 +36,4 @@ for exp in eList:
 
 conn.close()
 df = df.set_index('exposure', drop = True)
-df.to_csv('exp_list_full.list')
+ws.write('exp_list_full.list', df.to_csv())
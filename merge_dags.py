@@ -0,0 +1,321 @@
+"""A module to submit many per-exposure DAGs as a few merged DAGs.
+
+run_gw_workflow.py submits one DAG per exposure, so a big event means one
+jobsub_submit_dag call and one DAGMan scheduler per exposure. The functions
+in this script merge the per-exposure DAGs instead:
+    (1) Write a parent DAG that inlines each per-exposure DAG as DAGMan would
+        expand a SPLICE, prefixing its nodes with exp_<exp>+, with a MAXJOBS
+        throttle and a node status file, plus a manifest mapping each prefix
+        to its exposure, then
+    (2) Submit each parent DAG with a single jobsub_submit_dag call, and
+    (3) Fetch the node status file back with jobsub_fetchlog and report the
+        progress of each exposure from it.
+jobsub only ships the one .dag file it is given to the schedd, so the parent
+DAG must not refer to any other local file.
+"""
+
+import argparse
+import csv
+import logging
+import os
+import re
+import subprocess
+
+import pandas as pd
+
+import track_jobs
+import utils
+import validate_dag
+import workspace
+
+
+# DAGMan NodeStatus codes.
+NODE_STATUS = {
+    0: 'NOT_READY',
+    1: 'READY',
+    2: 'PRERUN',
+    3: 'SUBMITTED',
+    4: 'POSTRUN',
+    5: 'DONE',
+    6: 'ERROR',
+    7: 'FUTILE',
+}
+NODE_PATTERN = re.compile(r'Node\s*=\s*"([^"]+)";.*?NodeStatus\s*=\s*(\d+)', re.S)
+
+# DAG keywords followed by node names, and the position of the first name.
+NODE_KEYWORDS = {
+    'JOB': 1, 'DATA': 1, 'FINAL': 1, 'SPLICE': 1, 'VARS': 1, 'RETRY': 1,
+    'PRIORITY': 1, 'CATEGORY': 1, 'PRE_SKIP': 1, 'ABORT-DAG-ON': 1,
+    'SUBDAG': 2,
+}
+# DAG-wide settings of a per-exposure DAG, which the parent DAG sets instead.
+DAG_KEYWORDS = {'CONFIG', 'NODE_STATUS_FILE', 'JOBSTATE_LOG', 'DOT', 'MAXJOBS'}
+CATEGORY = 'merged'
+
+
+### Main functions.
+
+def splice_name(exposure: str) -> str:
+    """Make a DAGMan splice name for an exposure or a coadd set."""
+    return 'exp_' + re.sub(r'\W+', '_', str(exposure).strip())
+
+
+def _inline_line(line: str, prefix: str, nodes: list = ()) -> tuple:
+    """Prefix the node names of one DAG line.
+
+    A line for ALL_NODES is repeated for each of the given nodes, so that it
+    only applies to the nodes of its own DAG.
+
+    Returns:
+      The rewritten line(s) (None for DAG-wide settings) and the name of the
+      node it defines (None if it defines none).
+    """
+    tokens = line.split()
+    if len(tokens) == 0 or tokens[0].startswith('#'):
+        return line.rstrip('\n'), None
+    keyword = tokens[0].upper()
+    if keyword in DAG_KEYWORDS:
+        return None, None
+
+    if keyword == 'PARENT':
+        tokens = [t if t.upper() in ('PARENT', 'CHILD') else prefix + t for t in tokens]
+        return ' '.join(tokens), None
+    if keyword == 'SCRIPT':
+        # SCRIPT [DEFER status time] PRE|POST node ...
+        position = 5 if len(tokens) > 1 and tokens[1].upper() == 'DEFER' else 2
+    else:
+        position = NODE_KEYWORDS.get(keyword)
+    if position is None or len(tokens) <= position:
+        return line.rstrip('\n'), None
+
+    # Keep the rest of the line as is, so quoted VARS values are untouched.
+    head = line.split(None, position + 1)
+    if tokens[position] == 'ALL_NODES':
+        expanded = []
+        for node in nodes:
+            head[position] = node
+            expanded.append(' '.join(head).rstrip('\n'))
+        return '\n'.join(expanded), None
+    head[position] = prefix + head[position]
+    node = head[position] if keyword in ('JOB', 'DATA', 'FINAL', 'SUBDAG', 'SPLICE') else None
+    return ' '.join(head).rstrip('\n'), node
+
+
+@utils.log_start_and_finish
+def write_merged_dag(
+  dag_files: dict, outfile: str, maxjobs: int = None,
+  status_interval: int = 60) -> str:
+    """Write a parent DAG that inlines the per-exposure DAGs.
+
+    Every node of an exposure is renamed <splice_name(exposure)>+<node>, as
+    DAGMan names spliced nodes, so the parent DAG is self-contained. Lines
+    for ALL_NODES are expanded to the nodes of their exposure. The
+    throttle puts every node in one category with a MAXJOBS limit. The
+    manifest is written next to the parent DAG, with the .manifest extension.
+
+    Args:
+      dag_files (dict): A dict of {exposure: path to its .dag file}.
+      outfile (str): Path of the parent DAG.
+      maxjobs (int, default=None): Most node jobs submitted at once.
+      status_interval (int, default=60): Seconds between node status updates.
+
+    Returns:
+      The path of the manifest.
+    """
+    base = os.path.splitext(outfile)[0]
+    manifest = base + '.manifest'
+
+    lines = [f"# Merged DAG of {len(dag_files)} exposures.",
+             f"NODE_STATUS_FILE {os.path.basename(base)}.status {status_interval}"]
+    if maxjobs is not None:
+        lines.append(f"MAXJOBS {CATEGORY} {maxjobs}")
+
+    with workspace.atomic_open(manifest) as f:
+        writer = csv.writer(f)
+        writer.writerow(['splice', 'exposure', 'dag_file'])
+        for exposure, dag_file in dag_files.items():
+            name = splice_name(exposure)
+            lines.append(f"# {exposure}: {os.path.abspath(dag_file)}")
+            with open(dag_file) as dag:
+                dag_lines = dag.readlines()
+            # ALL_NODES does not apply to the FINAL node.
+            nodes = [_inline_line(line, name + '+')[1] for line in dag_lines
+                     if not line.lstrip().upper().startswith('FINAL')]
+            nodes = [node for node in nodes if node is not None]
+            for line in dag_lines:
+                line, node = _inline_line(line, name + '+', nodes)
+                if line is not None:
+                    lines.append(line)
+                if node is not None and maxjobs is not None:
+                    lines.append(f"CATEGORY {node} {CATEGORY}")
+            writer.writerow([name, exposure, os.path.abspath(dag_file)])
+
+    with workspace.atomic_open(outfile) as f:
+        f.write('\n'.join(lines) + '\n')
+    return manifest
+
+
+def merged_command(jobsub_cmd: str, merged_dag: str) -> str:
+    """Swap the .dag file of a jobsub_submit_dag command for the merged DAG."""
+    tokens = jobsub_cmd.split()
+    for i, token in enumerate(tokens):
+        if token.endswith('.dag'):
+            tokens[i] = 'file://' + os.path.abspath(merged_dag)
+    return ' '.join(tokens)
+
+
+@utils.log_start_and_finish
+def submit_merged(
+  submissions: list, group_size: int = 200, maxjobs: int = None,
+  prefix: str = 'merged', run_dir: str = '.') -> list:
+    """Merge per-exposure DAGs into groups and submit each group once.
+
+    The jobsub options of the first command in each group are reused for the
+    merged submission, which runs from run_dir like the per-exposure
+    submissions. The output of each submission is written to
+    jobsub_<prefix>_<i>.out, which track_jobs.py picks up.
+
+    Args:
+      submissions (list): (jobsub_submit_dag command, exposure) pairs.
+      group_size (int, default=200): Most exposures per merged DAG.
+      maxjobs (int, default=None): Most node jobs submitted at once per DAG.
+      prefix (str, default='merged'): Path prefix of the merged DAG files.
+      run_dir (str, default='.'): Directory the commands were made in and
+        are run from.
+
+    Returns:
+      The paths of the merged DAGs.
+    """
+    merged_dags = []
+    for i, start in enumerate(range(0, len(submissions), group_size)):
+        group = submissions[start:start + group_size]
+        dag_files = {}
+        for jobsub_cmd, exposure in group:
+            dag_file = validate_dag.get_dag_file(jobsub_cmd)
+            if dag_file is not None:
+                dag_files[exposure] = os.path.join(run_dir, dag_file)
+        if len(dag_files) == 0:
+            logging.warning(f"No .dag files in merge group {i}, skipping it.")
+            continue
+
+        merged_dag = f"{prefix}_{i}.dag"
+        write_merged_dag(dag_files, merged_dag, maxjobs)
+        merged_dags.append(merged_dag)
+
+        cmd = [merged_command(group[0][0], merged_dag)]
+        print("Submitting " + str(len(dag_files)) + " exposures with " + cmd[0])
+        process = subprocess.Popen(cmd, bufsize=1, shell=True, cwd=run_dir, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        stdout, stderr = process.communicate()
+        with workspace.atomic_open(jobsub_out_file(merged_dag)) as f:
+            f.write(stdout)
+        if process.returncode != 0:
+            print("Something went wrong with submitting " + merged_dag + ".")
+    return merged_dags
+
+
+def jobsub_out_file(merged_dag: str) -> str:
+    """Get the jobsub_<name>.out file of a merged DAG <name>.dag."""
+    name = os.path.splitext(os.path.basename(merged_dag))[0]
+    return os.path.join(os.path.dirname(merged_dag), f"jobsub_{name}.out")
+
+
+def fetch_status(
+  merged_dag: str, jobsub_fetchlog: list = ['jobsub_fetchlog', '-G', 'des']) -> str:
+    """Fetch the node status file of a submitted merged DAG from the schedd.
+
+    The logs of the DAGMan job are unpacked into <name>_logs next to the
+    merged DAG.
+
+    Args:
+      merged_dag (str): Path of the merged DAG.
+      jobsub_fetchlog (list): The jobsub_fetchlog command, without the
+        --jobid and --unzipdir arguments.
+
+    Returns:
+      The path of the fetched status file, or None if it could not be fetched.
+    """
+    base = os.path.splitext(merged_dag)[0]
+    jobids = track_jobs.get_job_ids(jobsub_out_file(merged_dag))
+    if len(jobids) == 0:
+        logging.warning(f"No job ID found for {merged_dag}.")
+        return None
+
+    log_dir = base + '_logs'
+    cmd = jobsub_fetchlog + ['--jobid', jobids[0], '--unzipdir', log_dir]
+    try:
+        process = subprocess.run(
+            cmd, universal_newlines=True, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+    except OSError as err:
+        logging.warning(f"jobsub_fetchlog could not be run: {err}")
+        return None
+    status_file = os.path.join(log_dir, os.path.basename(base) + '.status')
+    if process.returncode != 0 or not os.path.exists(status_file):
+        logging.warning(f"Could not fetch the status of {merged_dag}: {process.stdout.strip()}")
+        return None
+    return status_file
+
+
+@utils.log_start_and_finish
+def merged_status(
+  merged_dags: list,
+  jobsub_fetchlog: list = ['jobsub_fetchlog', '-G', 'des']) -> pd.DataFrame:
+    """Fetch the status of merged DAGs and count the node states per exposure.
+
+    Exposures of DAGs whose status could not be fetched are left out.
+
+    Returns:
+      The outputs of exposure_status for all merged DAGs, concatenated.
+    """
+    statuses = []
+    for merged_dag in merged_dags:
+        status_file = fetch_status(merged_dag, jobsub_fetchlog)
+        if status_file is not None:
+            statuses.append(exposure_status(
+                status_file, os.path.splitext(merged_dag)[0] + '.manifest'))
+    if len(statuses) == 0:
+        return pd.DataFrame(columns=['done'])
+    df = pd.concat(statuses)
+    states = [column for column in df.columns if column != 'done']
+    df[states] = df[states].fillna(0).astype(int)
+    return df[states + ['done']]
+
+
+@utils.log_start_and_finish
+def exposure_status(status_file: str, manifest: str) -> pd.DataFrame:
+    """Count the node states of each exposure in a merged DAG.
+
+    Args:
+      status_file (str): The NODE_STATUS_FILE written by DAGMan.
+      manifest (str): The manifest written by write_merged_dag.
+
+    Returns:
+      A DataFrame indexed by exposure with one column per node state and a
+      done column that is True once every node of the exposure is DONE.
+    """
+    splices = pd.read_csv(manifest, dtype=str).set_index('splice')['exposure']
+    with open(status_file) as f:
+        nodes = NODE_PATTERN.findall(f.read())
+
+    rows = []
+    for node, status in nodes:
+        name = node.split('+')[0]
+        if name in splices.index:
+            rows.append((splices[name], NODE_STATUS.get(int(status), status)))
+    df = pd.DataFrame(rows, columns=['exposure', 'state'])
+
+    counts = pd.crosstab(df['exposure'], df['state']).reindex(splices.values, fill_value=0)
+    counts.index.name = 'exposure'
+    total = counts.sum(axis=1)
+    counts['done'] = (total > 0) & (counts.get('DONE', 0) == total)
+    return counts
+
+
+### Runtime behavior.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--status', type=str, help="node status file of a merged DAG.")
+    parser.add_argument('--manifest', type=str)
+    args = parser.parse_args()
+
+    print(exposure_status(args.status, args.manifest).to_string())
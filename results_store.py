@@ -0,0 +1,237 @@
+"""A module to keep the results of every test run.
+
+fetchJobSubStats.py only pickles the latest counts. The functions in this
+script append each run to an SQLite database instead, so runs can be compared
+across seasons and pipeline releases:
+    (1) Append the per-exposure results of a run, which also updates the
+        per-run and per-step rollup tables, then
+    (2) Query failure rates per step over time, regressions between two runs,
+        and throughput per run from the rollups.
+
+Every table is keyed by (season, run_id, ...), so queries restricted to some
+seasons only read those rows, and the trend queries never scan the
+per-exposure tables.
+"""
+
+import argparse
+import sqlite3
+import time
+
+import pandas as pd
+
+import utils
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    season INTEGER, run_id TEXT, release TEXT, recorded REAL, wall_time REAL,
+    PRIMARY KEY (season, run_id));
+CREATE TABLE IF NOT EXISTS exposures (
+    season INTEGER, run_id TEXT, exposure INTEGER, nite INTEGER,
+    finished INTEGER, failed INTEGER, forcephoto INTEGER,
+    PRIMARY KEY (season, run_id, exposure));
+CREATE TABLE IF NOT EXISTS failures (
+    season INTEGER, run_id TEXT, exposure INTEGER, step TEXT, count INTEGER,
+    PRIMARY KEY (season, run_id, exposure, step));
+CREATE TABLE IF NOT EXISTS run_rollup (
+    season INTEGER, run_id TEXT, n_exposures INTEGER, finished INTEGER,
+    failed INTEGER, forcephoto INTEGER,
+    PRIMARY KEY (season, run_id));
+CREATE TABLE IF NOT EXISTS step_rollup (
+    season INTEGER, run_id TEXT, step TEXT, failures INTEGER,
+    PRIMARY KEY (season, run_id, step));
+"""
+
+
+### Main functions.
+
+def connect(store: str = 'results.db') -> sqlite3.Connection:
+    """Open the results store, creating the tables if needed."""
+    conn = sqlite3.connect(store)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+@utils.log_start_and_finish
+def append_run(
+  store: str, season: int, run_id: str, results: list, release: str = None,
+  wall_time: float = None):
+    """Append the results of one run to the store.
+
+    Args:
+      store (str): Path to the SQLite database.
+      season (int): The season of the run.
+      run_id (str): A unique name for the run within the season.
+      results (list): One dict per exposure with keys exposure, nite,
+        finished (# of CCDs), forcephoto (bool), and failures (a dict of
+        {step: # of CCDs}).
+      release (str, default=None): The pipeline release that was tested.
+      wall_time (float, default=None): Duration of the run in seconds.
+
+    Raises:
+      ValueError if the run is already in the store.
+    """
+    conn = connect(store)
+    try:
+        with conn:
+            exists = conn.execute(
+                "SELECT 1 FROM runs WHERE season=? AND run_id=?",
+                (season, run_id)).fetchone()
+            if exists is not None:
+                raise ValueError(f"Run {run_id} of season {season} is already stored.")
+
+            conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?)",
+                         (season, run_id, release, time.time(), wall_time))
+            conn.executemany(
+                "INSERT INTO exposures VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(season, run_id, int(r['exposure']), int(r['nite']),
+                  int(r['finished']), int(sum(r['failures'].values())),
+                  int(bool(r['forcephoto']))) for r in results])
+            conn.executemany(
+                "INSERT INTO failures VALUES (?, ?, ?, ?, ?)",
+                [(season, run_id, int(r['exposure']), step, int(count))
+                 for r in results for step, count in r['failures'].items()])
+
+            # Precompute the rollups for the trend queries.
+            conn.execute("""
+                INSERT INTO run_rollup
+                SELECT season, run_id, COUNT(*), SUM(finished), SUM(failed), SUM(forcephoto)
+                FROM exposures WHERE season=? AND run_id=?
+                GROUP BY season, run_id""", (season, run_id))
+            conn.execute("""
+                INSERT INTO step_rollup
+                SELECT season, run_id, step, SUM(count)
+                FROM failures WHERE season=? AND run_id=?
+                GROUP BY season, run_id, step""", (season, run_id))
+    finally:
+        conn.close()
+
+
+def _season_filter(seasons: list) -> tuple:
+    """Build a WHERE clause restricting a query to some seasons."""
+    if seasons is None:
+        return "", []
+    seasons = list(seasons)
+    return f" AND r.season IN ({','.join('?' * len(seasons))})", seasons
+
+
+@utils.log_start_and_finish
+def failure_rates(
+  store: str, step: str = None, seasons: list = None) -> pd.DataFrame:
+    """Get the failure rate of each step for each run, oldest run first.
+
+    The rate is the number of CCDs that failed on the step divided by the
+    number of finished CCDs in the run.
+
+    Args:
+      store (str): Path to the SQLite database.
+      step (str, default=None): Only return this step.
+      seasons (list, default=None): Only return runs from these seasons.
+
+    Returns:
+      A DataFrame with season, run_id, release, step, failures, finished,
+      and rate.
+    """
+    where, params = _season_filter(seasons)
+    if step is not None:
+        where += " AND s.step=?"
+        params.append(step)
+    conn = connect(store)
+    try:
+        df = pd.read_sql(f"""
+            SELECT r.season, r.run_id, r.release, s.step, s.failures, u.finished
+            FROM runs r
+            JOIN step_rollup s ON s.season=r.season AND s.run_id=r.run_id
+            JOIN run_rollup u ON u.season=r.season AND u.run_id=r.run_id
+            WHERE 1=1{where}
+            ORDER BY r.recorded, r.rowid, s.step""", conn, params=params)
+    finally:
+        conn.close()
+    df['rate'] = df['failures'] / df['finished'].where(df['finished'] > 0)
+    return df
+
+
+def _run_rates(conn: sqlite3.Connection, season: int, run_id: str) -> pd.Series:
+    """Get the failure rate of each step of one run, indexed by step."""
+    df = pd.read_sql("""
+        SELECT s.step, s.failures, u.finished
+        FROM step_rollup s
+        JOIN run_rollup u ON u.season=s.season AND u.run_id=s.run_id
+        WHERE s.season=? AND s.run_id=?""", conn, params=(season, run_id))
+    return (df['failures'] / df['finished'].where(df['finished'] > 0)).set_axis(df['step'])
+
+
+@utils.log_start_and_finish
+def regressions(
+  store: str, base_run: tuple, new_run: tuple,
+  threshold: float = 0.) -> pd.DataFrame:
+    """Find the steps whose failure rate went up between two runs.
+
+    Only the rollups of the two runs are read from the store.
+
+    Args:
+      store (str): Path to the SQLite database.
+      base_run (tuple): The (season, run_id) to compare against.
+      new_run (tuple): The (season, run_id) to check.
+      threshold (float, default=0.): Minimum increase in rate to report.
+
+    Returns:
+      A DataFrame indexed by step with base_rate, new_rate, and change,
+      sorted by the largest increase.
+    """
+    conn = connect(store)
+    try:
+        base = _run_rates(conn, int(base_run[0]), base_run[1])
+        new = _run_rates(conn, int(new_run[0]), new_run[1])
+    finally:
+        conn.close()
+    df = pd.DataFrame({'base_rate': base, 'new_rate': new}).fillna(0.)
+    df['change'] = df['new_rate'] - df['base_rate']
+    return df[df['change'] > threshold].sort_values('change', ascending=False)
+
+
+@utils.log_start_and_finish
+def throughput(store: str, seasons: list = None) -> pd.DataFrame:
+    """Get the throughput of each run, oldest run first.
+
+    Args:
+      store (str): Path to the SQLite database.
+      seasons (list, default=None): Only return runs from these seasons.
+
+    Returns:
+      A DataFrame with season, run_id, release, n_exposures, finished,
+      failed, forcephoto, wall_time, and ccds_per_hour (NaN when the wall
+      time is unknown).
+    """
+    where, params = _season_filter(seasons)
+    conn = connect(store)
+    try:
+        df = pd.read_sql(f"""
+            SELECT r.season, r.run_id, r.release, u.n_exposures, u.finished,
+                u.failed, u.forcephoto, r.wall_time
+            FROM runs r
+            JOIN run_rollup u ON u.season=r.season AND u.run_id=r.run_id
+            WHERE 1=1{where}
+            ORDER BY r.recorded, r.rowid""", conn, params=params)
+    finally:
+        conn.close()
+    df['wall_time'] = pd.to_numeric(df['wall_time'])
+    df['ccds_per_hour'] = df['finished'] / (df['wall_time'] / 3600.)
+    return df
+
+
+### Runtime behavior.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--store', type=str, default='results.db')
+    parser.add_argument('--step', type=str, default=None)
+    parser.add_argument('--seasons', type=int, nargs='*', default=None)
+    parser.add_argument('--compare', type=str, nargs=4, default=None,
+                        metavar=('BASE_SEASON', 'BASE_RUN', 'NEW_SEASON', 'NEW_RUN'))
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        print(regressions(args.store, args.compare[:2], args.compare[2:]).to_string())
+    else:
+        print(failure_rates(args.store, args.step, args.seasons).to_string(index=False))
+        print(throughput(args.store, args.seasons).to_string(index=False))
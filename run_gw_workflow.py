@@ -9,11 +9,11 @@ from subprocess import Popen, PIPE
 import argparse
 import sys
 
-# Arguments
-parser = argparse.ArgumentParser()
-parser.add_argument('--exp_list', type=str)
-parser.add_argument('--coadd', default=False)
-args = parser.parse_args()
+import merge_dags
+import template_precheck
+import track_jobs
+import validate_dag
+import workspace
 
 # Function
 def EXPlist(explist):
@@ -85,65 +85,211 @@ def getCoadd(eList):
     return coadd_str_list
 
 
-# Script
-exposures = EXPlist(args.exp_list)
+def validDAGs(jobsub_info, rel_exps, rc, n_templates, coadd, ws):
+    """Drop the jobsub commands whose .dag files fail validation.
 
-if args.coadd:
-    exposures = getCoadd(exposures)
+    Exposures with bad DAGs, or with a jobsub_submit_dag command whose DAG
+    cannot be found, are added to Problematic_DAGmaker_Outputs.txt.
+    """
+    dag_files = {}
+    results = {}
+    for jobsub_datum, exposure in zip(jobsub_info, rel_exps):
+        dag_file = validate_dag.get_dag_file(jobsub_datum)
+        if dag_file is not None:
+            dag_files[ws.file(dag_file)] = exposure
+        elif jobsub_datum.split()[:1] == ['jobsub_submit_dag']:
+            dag_files[jobsub_datum] = exposure
+            results[jobsub_datum] = ["no .dag file in the jobsub_submit_dag command"]
+
+    num_ccds = None if coadd else len(validate_dag.DECAM_CCDS)
+    num_templates = {d: n_templates[e] for d, e in dag_files.items() if e in n_templates}
+    results.update(validate_dag.validate_dags(
+        [d for d in dag_files if d not in results], num_ccds, num_templates, rc))
+
+    bad_exps = []
+    for dag_file, errors in results.items():
+        if len(errors) == 0:
+            continue
+        exposure = dag_files[dag_file]
+        bad_exps.append(exposure)
+        print("The DAG for " + exposure + " failed validation: " + '; '.join(errors))
+        f = open(ws.file('Problematic_DAGmaker_Outputs.txt'), 'a+')
+        f.write(str(exposure) + '\n')
+        f.close()
+
+    keep = [i for i, exposure in enumerate(rel_exps) if exposure not in bad_exps]
+    return [jobsub_info[i] for i in keep], [rel_exps[i] for i in keep]
+
+
+def queueMerge(jobsub_info, rel_exps, merge_queue):
+    """Move the jobsub_submit_dag commands to the merge queue.
+
+    Anything else is left in jobsub_info so it is still reported as problematic.
+    """
+    keep = []
+    for jobsub_datum, exposure in zip(jobsub_info, rel_exps):
+        if jobsub_datum.split()[0] == 'jobsub_submit_dag':
+            merge_queue.append((jobsub_datum, exposure))
+        else:
+            keep.append((jobsub_datum, exposure))
+    return [k[0] for k in keep], [k[1] for k in keep], merge_queue
+
+
+if __name__ == "__main__":
+    # Arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--exp_list', type=str)
+    parser.add_argument('--coadd', default=False)
+    parser.add_argument('--exp_table', type=str, default=None, help="exposures.csv from configure_dag.py; report exposures with no predicted templates.")
+    parser.add_argument('--prior_table', type=str, default=None, help="complete table of prior exposures; skip exposures with no possible templates.")
+    parser.add_argument('--rc', type=str, default=None, help="defaults to dagmaker.rc in the run directory.")
+    parser.add_argument('--validate_dags', action='store_true', help="check the .dag files before submitting them.")
+    parser.add_argument('--merge', type=int, default=0, help="submit the DAGs as merged DAGs of up to this many exposures.")
+    parser.add_argument('--maxjobs', type=int, default=None, help="DAGMan max submitted jobs per merged DAG.")
+    parser.add_argument('--track', action='store_true', help="poll the submitted jobs until they finish.")
+    workspace.add_arguments(parser)
+    args = parser.parse_args()
+    ws = workspace.from_args(args)
+    ws.acquire()
+    rc_file = args.rc or ws.file('dagmaker.rc')
+    dagmaker = os.path.abspath('DAGMaker.sh')
+
+    # Script
+    exposures = EXPlist(args.exp_list)
+    n_templates = {}
+    merge_queue = []
+    merged_dags = []
+    rc = template_precheck.read_dag_rc(rc_file) if args.validate_dags else None
+
+    if args.exp_table is not None:
+        # The exposure table only holds the configure_dag.py selection, which
+        # misses templates DAGMaker can find, so only skip with a full table.
+        coverage = template_precheck.precheck(args.exp_table, exposures, rc_file, args.prior_table)
+        no_templates = set(coverage['expnum'][coverage['n_templates'] == 0].astype(str))
+        skipped = ''
+        for exposure in exposures:
+            if exposure in no_templates:
+                if args.prior_table is not None:
+                    print('NO TEMPLATES PREDICTED FOR ' + exposure + ', SKIPPING DAGMAKER')
+                else:
+                    print('NO TEMPLATES PREDICTED FOR ' + exposure + ' FROM ' + args.exp_table)
+                skipped += exposure + '\n'
+        ws.write('No_Template_Exposures.txt', skipped)
+        if args.prior_table is not None:
+            exposures = [exp for exp in exposures if exp not in no_templates]
+        n_templates = dict(zip(coverage['expnum'].astype(str), coverage['n_templates']))
+
+    if args.coadd:
+        exposures = getCoadd(exposures)
+    
+    ## Get expsure groups
+    len_exps = len(exposures)
+    if args.coadd:
+        print("The number of coadd sets is " + str(len_exps) + ".")
+    else:
+        print("The number of exposures is "+ str(len_exps) + ".")
+    last_set_len = len_exps % 5 # For submissions of 4 DAGmaker run at a time, the size of the last set of DAGmaker runs
+    num_full_sets = len_exps // 5 # Number of DAGmaker sets of 4 runs
+    if last_set_len > 0:
+        number_o_sets = num_full_sets + 1
+        print("The number of threaded DAGmaker runs will be "+ str(number_o_sets)+": "+str(num_full_sets) + " sets of 5 DAGmaker runs and 1 set of "+ str(last_set_len) + " DAGmaker run(s).")
+    else:
+        number_o_sets = num_full_sets
+        print("The number of threaded DAGmaker runs will be "+ str(number_o_sets)+": "+str(num_full_sets) + " sets of 5 DAGmaker runs.")    
+
+    ## Run DAGMaker
+    start_index = 0
+    for i in range(num_full_sets):
+
+        exp1_index = start_index
+        exp2_index = start_index + 1
+        exp3_index = start_index + 2
+        exp4_index = start_index + 3
+        exp5_index = start_index + 4
+
+        start_index += 5
     
-## Get expsure groups
-len_exps = len(exposures)
-if args.coadd:
-    print("The number of coadd sets is " + str(len_exps) + ".")
-else:
-    print("The number of exposures is "+ str(len_exps) + ".")
-last_set_len = len_exps % 5 # For submissions of 4 DAGmaker run at a time, the size of the last set of DAGmaker runs
-num_full_sets = len_exps // 5 # Number of DAGmaker sets of 4 runs
-if last_set_len > 0:
-    number_o_sets = num_full_sets + 1
-    print("The number of threaded DAGmaker runs will be "+ str(number_o_sets)+": "+str(num_full_sets) + " sets of 5 DAGmaker runs and 1 set of "+ str(last_set_len) + " DAGmaker run(s).")
-else:
-    number_o_sets = num_full_sets
-    print("The number of threaded DAGmaker runs will be "+ str(number_o_sets)+": "+str(num_full_sets) + " sets of 5 DAGmaker runs.")    
-
-## Run DAGMaker
-start_index = 0
-for i in range(num_full_sets):
-
-    exp1_index = start_index
-    exp2_index = start_index + 1
-    exp3_index = start_index + 2
-    exp4_index = start_index + 3
-    exp5_index = start_index + 4
-
-    start_index += 5
+        cmd = [dagmaker + ' ' + exposures[exp1_index]]
+        process1 = subprocess.Popen(cmd, bufsize=1, shell=True, cwd=ws.path, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        print("Running " + cmd[0])
+        cmd = [dagmaker + ' ' + exposures[exp2_index]]
+        process2 = subprocess.Popen(cmd, bufsize=1, shell=True, cwd=ws.path, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        print("Running " + cmd[0])
+        cmd = [dagmaker + ' ' + exposures[exp3_index]]
+        process3 = subprocess.Popen(cmd, bufsize=1, shell=True, cwd=ws.path, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        print("Running " + cmd[0])
+        cmd = [dagmaker + ' ' + exposures[exp4_index]]
+        process4 = subprocess.Popen(cmd, bufsize=1, shell=True, cwd=ws.path, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        print("Running " + cmd[0])
+        cmd = [dagmaker + ' ' + exposures[exp5_index]]
+        process5 = subprocess.Popen(cmd, bufsize=1, shell=True, cwd=ws.path, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        print("Running " + cmd[0])
+
+        jobsub_info = []
+        rel_exps = []
+        for exposure, process in zip(exposures[exp1_index : exp5_index +1],[process1, process2, process3, process4, process5]):
+            stdout, stderr = process.communicate()
+            ws.write('dagmaker_'+exposure+'.out', stdout if stderr == None else stdout + stderr)
+            jsub = subprocess.check_output(['tail', '-3', ws.file('dagmaker_'+exposure+'.out')])
+            jsub = jsub.split(b'\n')
     
-    cmd = ['./DAGMaker.sh ' + exposures[exp1_index]]
-    process1 = subprocess.Popen(cmd, bufsize=1, shell=True, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    print("Running " + cmd[0])
-    cmd = ['./DAGMaker.sh ' + exposures[exp2_index]]
-    process2 = subprocess.Popen(cmd, bufsize=1, shell=True, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    print("Running " + cmd[0])
-    cmd = ['./DAGMaker.sh ' + exposures[exp3_index]]
-    process3 = subprocess.Popen(cmd, bufsize=1, shell=True, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    print("Running " + cmd[0])
-    cmd = ['./DAGMaker.sh ' + exposures[exp4_index]]
-    process4 = subprocess.Popen(cmd, bufsize=1, shell=True, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    print("Running " + cmd[0])
-    cmd = ['./DAGMaker.sh ' + exposures[exp5_index]]
-    process5 = subprocess.Popen(cmd, bufsize=1, shell=True, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    print("Running " + cmd[0])
+            try:
+
+                if jsub[0].decode('ascii') == 'NO TEMPLATE IMAGES, DIFFIMG WILL FAIL':
+                    print(jsub[0].decode('ascii'))
+                    continue
+                else:
+                    print('Jobsub command: ' + jsub[-2].decode('ascii'))
+                    jobsub_info.append(jsub[-2].decode('ascii'))
+                    rel_exps.append(exposure)
+
+            except(UnicodeDecodeError, AttributeError):
+
+                if jsub[0] == 'NO TEMPLATE IMAGES, DIFFIMG WILL FAIL':
+                    print(jsub[0])
+                    continue
+                else:
+                    print('Jobsub command: ' + jsub[-2])
+                    jobsub_info.append(jsub[-2])
+                    rel_exps.append(exposure)
+        
+        if args.validate_dags and args.merge == 0:
+            jobsub_info, rel_exps = validDAGs(jobsub_info, rel_exps, rc, n_templates, args.coadd, ws)
+
+        if args.merge > 0:
+            jobsub_info, rel_exps, merge_queue = queueMerge(jobsub_info, rel_exps, merge_queue)
 
+        for jobsub_datum in jobsub_info:
+            if jobsub_datum.split()[0] != 'jobsub_submit_dag':
+                f = open(ws.file('Problematic_DAGmaker_Outputs.txt'), 'a+')
+                f.write(str(exposure) + '\n')
+                f.close()
+            else:
+                cmd = [jobsub_datum]
+                process = subprocess.Popen(cmd, bufsize=1, shell=True, cwd=ws.path, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                stdout, stderr = process.communicate()
+                exposure = rel_exps[jobsub_info.index(jobsub_datum)]
+                ws.write('jobsub_'+exposure+'.out', stdout if stderr == None else stdout + stderr)
+                if stderr != None:
+                    print("Something went wrong with submitting the job for " + exposure + ".")
+
+    exp_ = []
+    proc_ = []
     jobsub_info = []
     rel_exps = []
-    for exposure, process in zip(exposures[exp1_index : exp5_index +1],[process1, process2, process3, process4, process5]):
+    for i in range(last_set_len):
+        exp_index = -1 - i 
+        cmd = [dagmaker + ' ' + exposures[exp_index]]
+        process = subprocess.Popen(cmd, bufsize=1, shell=True, cwd=ws.path, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        print('Running ' + cmd[0])
+    
+        exp_.append(exposures[exp_index])
+        proc_.append(process)
+    
+    for exposure, process in zip(exp_,proc_):
         stdout, stderr = process.communicate()
-        f = open('dagmaker_'+exposure+'.out', 'w')
-        f.write(stdout)
-        if stderr != None:
-            f.write(stderr)
-        f.close() 
-        jsub = subprocess.check_output(['tail', '-3', 'dagmaker_'+exposure+'.out'])
+        ws.write('dagmaker_'+exposure+'.out', stdout if stderr == None else stdout + stderr)
+        jsub = subprocess.check_output(['tail', '-3', ws.file('dagmaker_'+exposure+'.out')])
         jsub = jsub.split(b'\n')
     
         try:
@@ -155,9 +301,9 @@ for i in range(num_full_sets):
                 print('Jobsub command: ' + jsub[-2].decode('ascii'))
                 jobsub_info.append(jsub[-2].decode('ascii'))
                 rel_exps.append(exposure)
-
+            
         except(UnicodeDecodeError, AttributeError):
-
+        
             if jsub[0] == 'NO TEMPLATE IMAGES, DIFFIMG WILL FAIL':
                 print(jsub[0])
                 continue
@@ -165,80 +311,49 @@ for i in range(num_full_sets):
                 print('Jobsub command: ' + jsub[-2])
                 jobsub_info.append(jsub[-2])
                 rel_exps.append(exposure)
-        
+    
+    if args.validate_dags and args.merge == 0:
+        jobsub_info, rel_exps = validDAGs(jobsub_info, rel_exps, rc, n_templates, args.coadd, ws)
+
+    if args.merge > 0:
+        jobsub_info, rel_exps, merge_queue = queueMerge(jobsub_info, rel_exps, merge_queue)
+
     for jobsub_datum in jobsub_info:
         if jobsub_datum.split()[0] != 'jobsub_submit_dag':
-            f = open('Problematic_DAGmaker_Outputs.txt', 'a+')
+            f = open(ws.file('Problematic_DAGmaker_Outputs.txt'), 'a+')
             f.write(str(exposure) + '\n')
             f.close()
         else:
             cmd = [jobsub_datum]
-            process = subprocess.Popen(cmd, bufsize=1, shell=True, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            process = subprocess.Popen(cmd, bufsize=1, shell=True, cwd=ws.path, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             stdout, stderr = process.communicate()
             exposure = rel_exps[jobsub_info.index(jobsub_datum)]
-            f = open('jobsub_'+exposure+'.out', 'w')
-            f.write(stdout)
+            ws.write('jobsub_'+exposure+'.out', stdout if stderr == None else stdout + stderr)
             if stderr != None:
-                f.write(stderr)
                 print("Something went wrong with submitting the job for " + exposure + ".")
-            f.close()
 
-exp_ = []
-proc_ = []
-jobsub_info = []
-rel_exps = []
-for i in range(last_set_len):
-    exp_index = -1 - i 
-    cmd = ['./DAGMaker.sh ' + exposures[exp_index]]
-    process = subprocess.Popen(cmd, bufsize=1, shell=True, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    print('Running ' + cmd[0])
-    
-    exp_.append(exposures[exp_index])
-    proc_.append(process)
-    
-for exposure, process in zip(exp_,proc_):
-    stdout, stderr = process.communicate()
-    f = open('dagmaker_'+exposure+'.out', 'w')
-    f.write(stdout)
-    if stderr != None:
-        f.write(stderr)
-    f.close()
-    jsub = subprocess.check_output(['tail', '-3', 'dagmaker_'+exposure+'.out'])
-    jsub = jsub.split(b'\n')
-    
-    try:
+    ## Submit merged DAGs
+    if args.merge > 0:
+        # The merged DAGs are submitted at the end, so validate them all at once.
+        if args.validate_dags:
+            jobsub_info, rel_exps = validDAGs([m[0] for m in merge_queue], [m[1] for m in merge_queue],
+                                              rc, n_templates, args.coadd, ws)
+            merge_queue = list(zip(jobsub_info, rel_exps))
+        merged_dags = merge_dags.submit_merged(merge_queue, args.merge, args.maxjobs,
+                                               prefix=ws.file('merged'), run_dir=ws.path)
 
-        if jsub[0].decode('ascii') == 'NO TEMPLATE IMAGES, DIFFIMG WILL FAIL':
-            print(jsub[0].decode('ascii'))
-            continue
-        else:
-            print('Jobsub command: ' + jsub[-2].decode('ascii'))
-            jobsub_info.append(jsub[-2].decode('ascii'))
-            rel_exps.append(exposure)
-            
-    except(UnicodeDecodeError, AttributeError):
-        
-        if jsub[0] == 'NO TEMPLATE IMAGES, DIFFIMG WILL FAIL':
-            print(jsub[0])
-            continue
-        else:
-            print('Jobsub command: ' + jsub[-2])
-            jobsub_info.append(jsub[-2])
-            rel_exps.append(exposure)
-    
-for jobsub_datum in jobsub_info:
-    if jobsub_datum.split()[0] != 'jobsub_submit_dag':
-        f = open('Problematic_DAGmaker_Outputs.txt', 'a+')
-        f.write(str(exposure) + '\n')
-        f.close()
-    else:
-        cmd = [jobsub_datum]
-        process = subprocess.Popen(cmd, bufsize=1, shell=True, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        stdout, stderr = process.communicate()
-        exposure = rel_exps[jobsub_info.index(jobsub_datum)]
-        f = open('jobsub_'+exposure+'.out', 'w')
-        f.write(stdout)
-        if stderr != None:
-            f.write(stderr)
-            print("Something went wrong with submitting the job for " + exposure + ".")
-        f.close()
+    ## Track submitted jobs
+    if args.track:
+        # Polling only reads the submissions, so let other runs and checks in.
+        ws.release()
+        states = track_jobs.poll(track_jobs.collect_jobs(ws.file('jobsub_*.out')),
+                                 ws.file('job_timeline.csv'),
+                                 submitted=track_jobs.submit_times(ws.file('jobsub_*.out')))
+        print(pd.Series(states, dtype=object).value_counts().to_string())
+        if not track_jobs.is_done(states):
+            print("Stopped tracking before all jobs finished because jobsub_q kept failing.")
+        # The jobs of a merged DAG are tracked as one, so get the exposures from its node status.
+        if len(merged_dags) > 0:
+            status = merge_dags.merged_status(merged_dags)
+            ws.write('merged_exposure_status.csv', status.to_csv())
+            print(str(int(status['done'].sum())) + " of " + str(len(status)) + " merged exposures are done.")
@@ -0,0 +1,224 @@
+"""A module to predict template coverage before running DAGMaker.
+
+DAGMaker only reports 'NO TEMPLATE IMAGES, DIFFIMG WILL FAIL' after it has
+run. The functions in this script predict the same outcome up front from the
+exposure table written by configure_dag.py:
+    (1) Read the template rules (TEFF_CUT_*, MIN_NITE, MAX_NITE, and TWINDOW)
+        from dagmaker.rc, then
+    (2) Index the prior exposures by band and declination, and
+    (3) Count the prior exposures that overlap each search exposure and pass
+        the template rules.
+"""
+
+import argparse
+from dataclasses import dataclass
+import logging
+
+import numpy as np
+import pandas as pd
+
+import utils
+import workspace
+
+
+# DECam has a ~2.2 deg diameter field of view.
+DECAM_RADIUS = 1.1
+
+
+### Main functions.
+
+def read_dag_rc(rcfile: str = 'dagmaker.rc') -> dict:
+    """Read the KEY=VALUE pairs of a DAGMaker.rc file.
+
+    Args:
+      rcfile (str, default='dagmaker.rc'): Path to the rc file.
+
+    Returns:
+      A dict of {KEY: VALUE} with surrounding quotes removed from the values.
+    """
+    rc = {}
+    with open(rcfile) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#') or '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            rc[key.strip()] = value.strip().strip('"')
+    return rc
+
+
+@dataclass
+class TemplateRules:
+    teff_cuts: dict
+    min_nite: int
+    max_nite: int
+    twindow: float
+
+    @classmethod
+    def from_rc(cls, rc: dict) -> 'TemplateRules':
+        """Build the template rules from the output of read_dag_rc."""
+        teff_cuts = {key[len('TEFF_CUT_'):]: float(value)
+                     for key, value in rc.items() if key.startswith('TEFF_CUT_')}
+        return cls(teff_cuts=teff_cuts,
+                   min_nite=int(rc['MIN_NITE']),
+                   max_nite=int(rc['MAX_NITE']),
+                   twindow=float(rc['TWINDOW']))
+
+
+def _unit_vectors(ra: np.ndarray, dec: np.ndarray) -> np.ndarray:
+    """Convert RA and DEC in degrees to unit vectors."""
+    ra, dec = np.radians(ra), np.radians(dec)
+    return np.column_stack(
+        [np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)])
+
+
+def _overlap_fraction(sep: np.ndarray, radius: float) -> np.ndarray:
+    """Fraction of a circular footprint covered by an equal circle at sep.
+
+    This is the flat-sky lens area of two circles of the given radius, which
+    stands in for the fraction of CCDs that a template covers.
+    """
+    d = np.clip(sep / (2. * radius), 0., 1.)
+    return 2. / np.pi * (np.arccos(d) - d * np.sqrt(1. - d ** 2))
+
+
+class ExposureIndex:
+    """A band and declination index of prior exposures.
+
+    Exposures are bucketed by band and by declination strips as wide as the
+    overlap distance, so a lookup only computes separations for exposures in
+    the same band and in the strips next to the search exposure.
+    """
+    def __init__(self, prior_df: pd.DataFrame, radius: float = DECAM_RADIUS):
+        self.df = prior_df.reset_index(drop=True)
+        self.max_sep = 2. * radius
+        self.radius = radius
+        self.vectors = _unit_vectors(self.df['radeg'].values.astype(float),
+                                     self.df['decdeg'].values.astype(float))
+        strips = self._strip(self.df['decdeg'].values.astype(float))
+        self.buckets = {
+            key: rows.values
+            for key, rows in self.df.groupby([self.df['band'], strips]).groups.items()
+        }
+
+    def _strip(self, dec):
+        return np.floor((np.asarray(dec) + 90.) / self.max_sep).astype(int)
+
+    def query(self, ra: float, dec: float, band: str):
+        """Find the prior exposures that overlap a pointing.
+
+        Returns:
+          The row positions of the overlapping exposures and their overlap
+          fractions.
+        """
+        strip = int(self._strip(dec))
+        candidates = [self.buckets.get((band, s), []) for s in (strip - 1, strip, strip + 1)]
+        rows = np.concatenate(candidates).astype(int)
+        if len(rows) == 0:
+            return rows, np.array([])
+        cos_sep = self.vectors[rows] @ _unit_vectors(np.array([ra]), np.array([dec]))[0]
+        sep = np.degrees(np.arccos(np.clip(cos_sep, -1., 1.)))
+        overlaps = sep < self.max_sep
+        return rows[overlaps], _overlap_fraction(sep[overlaps], self.radius)
+
+
+@utils.log_start_and_finish
+def predict_templates(
+  search_df: pd.DataFrame, prior_df: pd.DataFrame, rules: TemplateRules,
+  radius: float = DECAM_RADIUS) -> pd.DataFrame:
+    """Predict the template coverage of each search exposure.
+
+    A prior exposure counts as a template for a search exposure if it has the
+    same band, overlaps its footprint, has teff >= TEFF_CUT_<band>, was taken
+    between MIN_NITE and MAX_NITE, and is more than TWINDOW days from the
+    search exposure.
+
+    Args:
+      search_df (pd.DataFrame): The search exposures.
+      prior_df (pd.DataFrame): The candidate template exposures.
+      rules (TemplateRules): The template rules from dagmaker.rc.
+      radius (float, default=DECAM_RADIUS): Footprint radius in degrees.
+
+    Returns:
+      A DataFrame with expnum, band, n_templates, coverage (the approximate
+      fraction of CCDs covered by the best template), and templates.
+    """
+    teff_cut = prior_df['band'].map(rules.teff_cuts).fillna(0.).values
+    nites = prior_df['nite'].values.astype(int)
+    usable = ((prior_df['teff'].values.astype(float) >= teff_cut)
+              & (nites >= rules.min_nite) & (nites <= rules.max_nite))
+    index = ExposureIndex(prior_df[usable], radius)
+    mjds = index.df['mjd_obs'].values.astype(float)
+    expnums = index.df['expnum'].values
+
+    results = []
+    for exp in search_df.itertuples(index=False):
+        rows, fractions = index.query(float(exp.radeg), float(exp.decdeg), exp.band)
+        keep = ((np.abs(mjds[rows] - float(exp.mjd_obs)) > rules.twindow)
+                & (expnums[rows] != exp.expnum))
+        results.append({
+            'expnum': exp.expnum,
+            'band': exp.band,
+            'n_templates': int(keep.sum()),
+            'coverage': float(fractions[keep].max()) if keep.any() else 0.,
+            'templates': expnums[rows[keep]].tolist(),
+        })
+    return pd.DataFrame(
+        results, columns=['expnum', 'band', 'n_templates', 'coverage', 'templates'])
+
+
+@utils.log_start_and_finish
+def precheck(
+  exp_table: str, exposures: list, rcfile: str = 'dagmaker.rc',
+  prior_table: str = None) -> pd.DataFrame:
+    """Predict the template coverage of a list of search exposures.
+
+    Args:
+      exp_table (str): Exposure table CSV written by configure_dag.py.
+      exposures (list): The search exposure numbers.
+      rcfile (str, default='dagmaker.rc'): Path to the rc file.
+      prior_table (str, default=None): CSV of candidate templates. Defaults
+        to exp_table.
+
+    Returns:
+      The output of predict_templates for the exposures.
+    """
+    exp_df = pd.read_csv(exp_table)
+    prior_df = exp_df if prior_table is None else pd.read_csv(prior_table)
+    exposures = [int(e) for e in exposures]
+    search_df = exp_df[exp_df['expnum'].isin(exposures)]
+
+    missing = set(exposures) - set(search_df['expnum'])
+    if len(missing) > 0:
+        logging.warning(f"Exposures not in {exp_table}: {sorted(missing)}")
+
+    coverage = predict_templates(search_df, prior_df, TemplateRules.from_rc(read_dag_rc(rcfile)))
+    for row in coverage[coverage['n_templates'] == 0].itertuples():
+        logging.info(f"No templates predicted for {row.expnum}.")
+    return coverage
+
+
+### Runtime behavior.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--exp_table', type=str, help="exposures.csv from configure_dag.py.")
+    parser.add_argument('--exp_list', type=str)
+    parser.add_argument('--rc', type=str, default=None, help="defaults to dagmaker.rc in the run directory.")
+    parser.add_argument('--prior_table', type=str, default=None)
+    parser.add_argument('--outfile', type=str, default='no_template_exposures.list')
+    workspace.add_arguments(parser)
+    args = parser.parse_args()
+    ws = workspace.from_args(args)
+
+    utils._setup_logging(ws.file('template_precheck.log'))
+
+    with open(args.exp_list) as f:
+        exposures = [exp.strip() for exp in f if exp.strip()]
+
+    coverage = precheck(args.exp_table, exposures, args.rc or ws.file('dagmaker.rc'), args.prior_table)
+    print(coverage[['expnum', 'band', 'n_templates', 'coverage']].to_string(index=False))
+
+    doomed = coverage['expnum'][coverage['n_templates'] == 0]
+    print(f"{len(doomed)} of {len(coverage)} exposures have no possible templates.")
+    with workspace.atomic_open(ws.file(args.outfile)) as f:
+        np.savetxt(f, doomed.values, fmt='%d')
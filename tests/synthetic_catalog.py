@@ -0,0 +1,83 @@
+"""Synthetic exposure catalogs for the benchmark suite.
+
+The catalogs have the columns returned by the exposure query in
+configure_dag.get_exposure_info, with nights of consecutive exposures,
+repeated visits of a fixed set of pointings, and DES-like band, exposure
+time, and teff distributions.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+BANDS = ['g', 'r', 'i', 'z', 'Y', 'u']
+BAND_WEIGHTS = [0.25, 0.25, 0.2, 0.2, 0.05, 0.05]
+EXPTIMES = [30., 60., 90., 150., 200., 300.]
+EXPTIME_WEIGHTS = [0.15, 0.3, 0.3, 0.1, 0.1, 0.05]
+
+
+def make_catalog(num_rows: int, seed: int = 0, first_expnum: int = 900000,
+                 first_mjd: float = 58849.) -> pd.DataFrame:
+    """Make a synthetic exposure catalog.
+
+    Args:
+      num_rows (int): Number of exposures.
+      seed (int, default=0): Seed for the random generator.
+      first_expnum (int, default=900000): Exposure number of the first row.
+      first_mjd (float, default=58849.): MJD of the first observing night.
+
+    Returns:
+      A DataFrame with expnum, nite, mjd_obs, radeg, decdeg, band, exptime,
+      propid, obstype, teff, and object, sorted by expnum.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Nights with ~100 exposures each, skipping some nights for weather.
+    per_night = rng.poisson(100, size=num_rows // 50 + 2) + 1
+    night_offsets = np.cumsum(rng.choice([1, 1, 1, 2, 3], size=len(per_night)))
+    night_of_row = np.repeat(np.arange(len(per_night)), per_night)[:num_rows]
+    position = np.arange(num_rows) - np.searchsorted(night_of_row, night_of_row)
+
+    exptime = rng.choice(EXPTIMES, size=num_rows, p=EXPTIME_WEIGHTS)
+    mjd_obs = (first_mjd + night_offsets[night_of_row] + 0.05
+               + position * (exptime + 30.) / 86400.)
+    nite = pd.to_datetime(np.floor(mjd_obs - 0.5) - 40587., unit='D').strftime('%Y%m%d')
+
+    # Revisit a fixed set of pointings so exposures overlap.
+    num_pointings = max(num_rows // 20, 10)
+    pointing_ra = rng.uniform(0., 360., size=num_pointings)
+    pointing_dec = np.degrees(np.arcsin(rng.uniform(-1., 0.5, size=num_pointings)))
+    pointing = rng.integers(0, num_pointings, size=num_rows)
+    dither = rng.normal(0., 0.1, size=(2, num_rows))
+
+    return pd.DataFrame({
+        'expnum': first_expnum + np.arange(num_rows),
+        'nite': nite,
+        'mjd_obs': mjd_obs,
+        'radeg': (pointing_ra[pointing] + dither[0]) % 360.,
+        'decdeg': np.clip(pointing_dec[pointing] + dither[1], -90., 90.),
+        'band': rng.choice(BANDS, size=num_rows, p=BAND_WEIGHTS),
+        'exptime': exptime,
+        'propid': rng.choice(['2012B-0001', '2019A-0065', '2021B-0149'], size=num_rows),
+        'obstype': 'object',
+        'teff': np.round(rng.beta(4., 3., size=num_rows) * 1.3, 2),
+        'object': [f'pointing {p}' for p in pointing],
+    })
+
+
+def make_ccd_paths(num_ccds: int, seed: int = 0, fail_fraction: float = 0.2,
+                   steps: int = 5) -> tuple:
+    """Make finished and .FAIL paths as globbed by fetchJobSubStats.py.
+
+    Returns:
+      A list of finished tarball paths and a list of .FAIL paths.
+    """
+    rng = np.random.default_rng(seed)
+    prefix = '/pnfs/des/persistent/gw/exp/20211004/1040414/dp2111/'
+    ccds = [f'{b}_{c:04d}' for b, c in zip(rng.choice(BANDS[:4], num_ccds), range(num_ccds))]
+    files_finished = [f'{prefix}{ccd}/{ccd}.tar.gz' for ccd in ccds]
+    failed = rng.random(num_ccds) < fail_fraction
+    run_nums = rng.integers(1, steps + 1, size=num_ccds)
+    files_failed = [f'{prefix}{ccd}/RUN{run:02d}_step.FAIL'
+                    for ccd, fail, run in zip(ccds, failed, run_nums) if fail]
+    return files_finished, files_failed
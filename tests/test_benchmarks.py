@@ -0,0 +1,164 @@
+"""Scaling benchmarks for the hot paths of the testing suite.
+
+Run from the tests directory with pytest-benchmark installed:
+    BENCHMARK_MAX_ROWS=1000000 pytest test_benchmarks.py
+
+The catalogs scale from 10^3 rows up to BENCHMARK_MAX_ROWS (default 10^3,
+at most 10^6). The peak memory of each benchmark is checked against
+benchmark_baseline.json, which has an entry for every size. The mean time is
+only checked with BENCHMARK_CHECK_TIME=1, since it depends on the host; set
+BENCHMARK_UPDATE_BASELINE=1 to rewrite that file on the reference machine.
+"""
+
+import json
+import os
+import re
+import sys
+import tracemalloc
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+sys.path.append('..')
+import configure_dag
+import fetchJobSubStats
+import make_postproc_ini
+import run_gw_workflow
+import synthetic_catalog
+
+
+MAX_ROWS = int(os.environ.get('BENCHMARK_MAX_ROWS', 10 ** 3))
+SIZES = [n for n in [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6] if n <= MAX_ROWS]
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'benchmark_baseline.json')
+MEMORY_TOLERANCE = 0.25
+# Timings vary more between machines than memory does.
+TIME_TOLERANCE = 1.0
+UPDATE_BASELINE = os.environ.get('BENCHMARK_UPDATE_BASELINE') == '1'
+CHECK_TIME = os.environ.get('BENCHMARK_CHECK_TIME') == '1'
+
+
+def _sizes(limit: int) -> list:
+    """The catalog sizes for a benchmark whose cost grows faster than O(n)."""
+    return [n for n in SIZES if n <= limit]
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+    yield baseline
+    if UPDATE_BASELINE:
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def _run(benchmark, baseline, name, func, *args, rounds=None):
+    """Benchmark func and check its mean time and peak memory against the baseline."""
+    tracemalloc.start()
+    func(*args)
+    peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    benchmark.extra_info['peak_memory_mb'] = peak_mb
+
+    if rounds is None:
+        output = benchmark(func, *args)
+    else:
+        output = benchmark.pedantic(func, args=args, rounds=rounds, iterations=1)
+
+    # The stats are missing with --benchmark-disable.
+    mean_s = benchmark.stats.stats.mean if benchmark.stats is not None else None
+    if UPDATE_BASELINE:
+        baseline[name] = {'peak_memory_mb': round(peak_mb, 3)}
+        if mean_s is not None:
+            baseline[name]['mean_s'] = round(mean_s, 6)
+        return output
+
+    assert name in baseline, f"{name} has no baseline, set BENCHMARK_UPDATE_BASELINE=1"
+    limit = baseline[name]['peak_memory_mb'] * (1. + MEMORY_TOLERANCE) + 1.
+    assert peak_mb <= limit, f"{name} peak memory {peak_mb:.1f} MB > {limit:.1f} MB"
+    if CHECK_TIME and mean_s is not None and 'mean_s' in baseline[name]:
+        limit = baseline[name]['mean_s'] * (1. + TIME_TOLERANCE) + 0.001
+        assert mean_s <= limit, f"{name} mean time {mean_s:.4f} s > {limit:.4f} s"
+    return output
+
+
+def _search_catalog(num_rows: int) -> pd.DataFrame:
+    catalog = synthetic_catalog.make_catalog(num_rows)
+    catalog['SEARCH'] = (catalog.index % 10 == 0).astype(str)
+    return catalog
+
+
+@pytest.mark.parametrize('num_rows', SIZES)
+def test_get_exposure_info(benchmark, baseline, num_rows):
+    """Selection of search exposures, with the database mocked."""
+    catalog = synthetic_catalog.make_catalog(num_rows)
+    with mock.patch.object(configure_dag.psycopg2, 'connect'), \
+         mock.patch.object(configure_dag.pd, 'read_sql', side_effect=lambda *a, **k: catalog.copy()), \
+         mock.patch('builtins.print'):
+        df = _run(benchmark, baseline, f'get_exposure_info[{num_rows}]',
+                  configure_dag.get_exposure_info, 60., -30.)
+    assert 0 < df['SEARCH'].sum() <= 20
+
+
+@pytest.mark.parametrize('num_rows', SIZES)
+def test_get_time_boundaries(benchmark, baseline, num_rows):
+    catalog = _search_catalog(num_rows)
+    time_info = _run(benchmark, baseline, f'get_time_boundaries[{num_rows}]',
+                     configure_dag._get_time_boundaries, catalog)
+    assert time_info.twindow > 2.
+
+
+@pytest.mark.parametrize('num_rows', _sizes(10 ** 4))
+def test_get_coadd(benchmark, baseline, num_rows):
+    """Grouping of exposures into coadd sets, with the database mocked."""
+    catalog = synthetic_catalog.make_catalog(num_rows).rename(columns={'expnum': 'exposure'})
+    catalog = catalog[['exposure', 'nite', 'radeg', 'decdeg', 'band']].set_index('exposure')
+    pattern = re.compile(r'WHERE id =(\d+)')
+
+    def read_sql(query, conn):
+        exposure = int(pattern.search(query).group(1))
+        return catalog.loc[[exposure]].reset_index()
+
+    explist = [str(e) for e in catalog.index]
+    with mock.patch.object(run_gw_workflow.psycopg2, 'connect'), \
+         mock.patch.object(run_gw_workflow.pd, 'read_sql', side_effect=read_sql):
+        coadds = _run(benchmark, baseline, f'get_coadd[{num_rows}]',
+                      run_gw_workflow.getCoadd, explist, rounds=3)
+    assert len(coadds) > 0
+
+
+@pytest.mark.parametrize('num_ccds', _sizes(10 ** 4))
+def test_count_failures(benchmark, baseline, num_ccds):
+    """Per-step failure aggregation of fetchJobSubStats.py."""
+    files_finished, files_failed = synthetic_catalog.make_ccd_paths(num_ccds)
+    failures = _run(benchmark, baseline, f'count_failures[{num_ccds}]',
+                    fetchJobSubStats.count_failures, files_finished, files_failed)
+    assert sum(failures.values()) == len(files_failed)
+
+
+@pytest.mark.parametrize('num_rows', SIZES)
+def test_write_dag_rc(benchmark, baseline, num_rows, tmp_path):
+    catalog = _search_catalog(num_rows)
+    outfile = str(tmp_path / 'dagmaker.rc')
+    _run(benchmark, baseline, f'write_dag_rc[{num_rows}]',
+         configure_dag.write_dag_rc, catalog, 2111, outfile)
+    assert os.path.exists(outfile)
+
+
+def test_make_postproc_ini(benchmark, baseline, tmp_path):
+    outfile = str(tmp_path / 'postproc_2111.ini')
+
+    def write_ini():
+        config = make_postproc_ini.make_postproc_config(
+            2111, 59492.3, '2021B-0149', 'exposures.list', 'g,r,i,z')
+        with open(outfile, 'w') as configfile:
+            config.write(configfile)
+
+    _run(benchmark, baseline, 'make_postproc_ini', write_ini)
+    assert os.path.exists(outfile)
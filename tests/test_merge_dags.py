@@ -0,0 +1,182 @@
+"""Unit tests for merge_dags.py"""
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.append('..')
+import merge_dags
+import track_jobs
+import validate_dag
+
+
+FAKE_JOBSUB_SUBMIT_DAG = """#!/bin/sh
+echo "Submitting $@ from $(pwd)"
+echo "Use job id $$.0@jobsub01.fnal.gov to retrieve output"
+"""
+
+# Unpacks a status file into the --unzipdir, named after the merged DAG.
+FAKE_JOBSUB_FETCHLOG = """#!/bin/sh
+while [ $# -gt 0 ]; do
+    if [ "$1" = "--unzipdir" ]; then dir=$2; fi
+    shift
+done
+mkdir -p $dir
+cp {status} $dir/$(basename $dir _logs).status
+"""
+
+STATUS_FILE = """
+[
+  Type = "DagStatus";
+  DagFiles = { "merged_0.dag" };
+]
+[
+  Type = "NodeStatus";
+  Node = "exp_1040414+SE_0_1";
+  NodeStatus = 5; /* "STATUS_DONE" */
+]
+[
+  Type = "NodeStatus";
+  Node = "exp_1040414+DIFFIMG_1";
+  NodeStatus = 5; /* "STATUS_DONE" */
+]
+[
+  Type = "NodeStatus";
+  Node = "exp_1040416+SE_0_1";
+  NodeStatus = 3; /* "STATUS_SUBMITTED" */
+]
+[
+  Type = "NodeStatus";
+  Node = "exp_1040416+DIFFIMG_1";
+  NodeStatus = 0; /* "STATUS_NOT_READY" */
+]
+"""
+
+
+class TestMergeDAGs(unittest.TestCase):
+    """Validate merge_dags.py functionalities."""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.submissions = []
+        for exp in ['1040414', '1040416', '1040417']:
+            dag_dir = os.path.join(self.tmpdir, exp)
+            os.makedirs(dag_dir)
+            dag_file = os.path.join(dag_dir, f'desgw_pipeline_{exp}.dag')
+            with open(dag_file, 'w') as f:
+                f.write('JOB SE_0_1 SE.sub\nJOB DIFFIMG_1 diffimg.sub\n'
+                        'PARENT SE_0_1 CHILD DIFFIMG_1\n')
+            self.submissions.append(
+                (f'{self.tmpdir}/jobsub_submit_dag -G des file://{dag_file}', exp))
+
+        self.status_file = os.path.join(self.tmpdir, 'status.txt')
+        with open(self.status_file, 'w') as f:
+            f.write(STATUS_FILE)
+        fakes = {'jobsub_submit_dag': FAKE_JOBSUB_SUBMIT_DAG,
+                 'jobsub_fetchlog': FAKE_JOBSUB_FETCHLOG.format(status=self.status_file)}
+        for name, script in fakes.items():
+            fake = os.path.join(self.tmpdir, name)
+            with open(fake, 'w') as f:
+                f.write(script)
+            os.chmod(fake, os.stat(fake).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_merged_dag(self):
+        """Check the inlined nodes, throttle, and manifest of a merged DAG."""
+        merged = os.path.join(self.tmpdir, 'merged.dag')
+        dag_files = {exp: validate_dag.get_dag_file(cmd) for cmd, exp in self.submissions}
+        manifest = merge_dags.write_merged_dag(dag_files, merged, maxjobs=100)
+
+        graph = validate_dag.parse_dag(merged)
+        self.assertEqual(graph.errors, [])
+        self.assertEqual(len(graph.names), 6)
+        self.assertEqual(graph.children[graph.names['exp_1040414+SE_0_1']],
+                         [graph.names['exp_1040414+DIFFIMG_1']])
+        with open(merged) as f:
+            text = f.read()
+        self.assertIn('MAXJOBS merged 100\n', text)
+        self.assertEqual(text.count('CATEGORY '), 6)
+        # The merged DAG is the only file jobsub ships, so it must not refer to others.
+        self.assertNotIn('SPLICE', text)
+        self.assertNotIn('CONFIG', text)
+        with open(manifest) as f:
+            self.assertEqual(len(f.readlines()), 4)
+
+    def test_write_merged_dag_fails(self):
+        """Check that a failed merge leaves no partial files behind."""
+        merged = os.path.join(self.tmpdir, 'merged.dag')
+        dag_files = {'1040414': os.path.join(self.tmpdir, 'missing.dag')}
+        before = sorted(os.listdir(self.tmpdir))
+        with self.assertRaises(FileNotFoundError):
+            merge_dags.write_merged_dag(dag_files, merged)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), before)
+
+    def test_all_nodes(self):
+        """Check that ALL_NODES only applies to the nodes of its own exposure."""
+        dag_files = {}
+        for exp, retries in [('1040414', 3), ('1040416', 5)]:
+            dag_files[exp] = os.path.join(self.tmpdir, f'{exp}.dag')
+            with open(dag_files[exp], 'w') as f:
+                f.write(f'VARS ALL_NODES expnum="{exp}"\nRETRY ALL_NODES {retries}\n'
+                        'JOB SE_0_1 SE.sub\nJOB DIFFIMG_1 diffimg.sub\n')
+        merged = os.path.join(self.tmpdir, 'merged.dag')
+        merge_dags.write_merged_dag(dag_files, merged)
+
+        with open(merged) as f:
+            text = f.read()
+        self.assertNotIn('ALL_NODES', text)
+        for exp, retries in [('1040414', 3), ('1040416', 5)]:
+            for node in ['SE_0_1', 'DIFFIMG_1']:
+                self.assertIn(f'VARS exp_{exp}+{node} expnum="{exp}"\n', text)
+                self.assertIn(f'RETRY exp_{exp}+{node} {retries}\n', text)
+        self.assertEqual(text.count('VARS '), 4)
+        self.assertEqual(text.count('RETRY '), 4)
+        self.assertEqual(validate_dag.parse_dag(merged).errors, [])
+
+    def test_inline_line(self):
+        """Check that only node names are prefixed."""
+        self.assertEqual(
+            merge_dags._inline_line('VARS SE_0_1 args="a b" ccd="1"\n', 'exp_1+'),
+            ('VARS exp_1+SE_0_1 args="a b" ccd="1"', None))
+        self.assertEqual(
+            merge_dags._inline_line('SCRIPT DEFER 4 60 POST SE_0_1 post.sh\n', 'exp_1+'),
+            ('SCRIPT DEFER 4 60 POST exp_1+SE_0_1 post.sh', None))
+        self.assertEqual(merge_dags._inline_line('CONFIG dagman.config\n', 'exp_1+'), (None, None))
+
+    def test_submit_merged(self):
+        """Check that each group is submitted once and can be tracked."""
+        prefix = os.path.join(self.tmpdir, 'merged')
+        # The last group has no .dag file, so it is skipped.
+        submissions = self.submissions + [('ERROR: no dag', '1040418'), ('ERROR: no dag', '1040419')]
+        merged_dags = merge_dags.submit_merged(
+            submissions, group_size=2, maxjobs=10, prefix=prefix, run_dir=self.tmpdir)
+        self.assertEqual(merged_dags, [prefix + '_0.dag', prefix + '_1.dag'])
+
+        jobsub_out = os.path.join(self.tmpdir, 'jobsub_merged_0.out')
+        with open(jobsub_out) as f:
+            self.assertIn('-G des file://' + prefix + '_0.dag from ' + self.tmpdir, f.read())
+        jobs = track_jobs.collect_jobs(os.path.join(self.tmpdir, 'jobsub_merged_*.out'))
+        self.assertEqual(set(jobs.values()), {'merged_0', 'merged_1'})
+
+        status = merge_dags.merged_status(
+            merged_dags, jobsub_fetchlog=[os.path.join(self.tmpdir, 'jobsub_fetchlog')])
+        self.assertEqual(list(status.index), ['1040414', '1040416', '1040417'])
+        self.assertEqual(list(status['done']), [True, False, False])
+
+    def test_exposure_status(self):
+        """Check the per-exposure node states from the status file."""
+        merged = os.path.join(self.tmpdir, 'merged_0.dag')
+        dag_files = {exp: validate_dag.get_dag_file(cmd) for cmd, exp in self.submissions}
+        manifest = merge_dags.write_merged_dag(dag_files, merged)
+        status = merge_dags.exposure_status(self.status_file, manifest)
+        self.assertEqual(list(status.index), ['1040414', '1040416', '1040417'])
+        self.assertEqual(list(status['done']), [True, False, False])
+        self.assertEqual(status.loc['1040416', 'SUBMITTED'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
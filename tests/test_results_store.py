@@ -0,0 +1,104 @@
+"""Unit tests for results_store.py"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.append('..')
+import fetchJobSubStats
+import results_store
+
+
+class TestResultsStore(unittest.TestCase):
+    """Validate results_store.py functionalities."""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = os.path.join(self.tmpdir, 'results.db')
+
+        results_store.append_run(self.store, 2110, 'oct', [
+            {'exposure': 1040414, 'nite': 20211004, 'finished': 50,
+             'forcephoto': True, 'failures': {'RUN04': 5}},
+            {'exposure': 1040416, 'nite': 20211004, 'finished': 50,
+             'forcephoto': False, 'failures': {'RUN04': 5, 'RUN20': 2}},
+        ], release='gw7', wall_time=7200.)
+        results_store.append_run(self.store, 2111, 'nov', [
+            {'exposure': 1040414, 'nite': 20211004, 'finished': 100,
+             'forcephoto': True, 'failures': {'RUN04': 30, 'RUN20': 1}},
+        ], release='gw8')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_append_only(self):
+        """Check that a run cannot be stored twice."""
+        with self.assertRaises(ValueError):
+            results_store.append_run(self.store, 2110, 'oct', [])
+
+    def test_failure_rates(self):
+        """Check the per-step rates and the season and step filters."""
+        rates = results_store.failure_rates(self.store)
+        self.assertEqual(list(rates['run_id']), ['oct', 'oct', 'nov', 'nov'])
+        self.assertAlmostEqual(rates['rate'].iloc[0], 0.1)
+
+        rates = results_store.failure_rates(self.store, step='RUN20', seasons=[2111])
+        self.assertEqual(len(rates), 1)
+        self.assertAlmostEqual(rates['rate'].iloc[0], 0.01)
+
+    def test_regressions(self):
+        """Check that only the steps that got worse are reported."""
+        changes = results_store.regressions(self.store, (2110, 'oct'), (2111, 'nov'))
+        self.assertEqual(list(changes.index), ['RUN04'])
+        self.assertAlmostEqual(changes.loc['RUN04', 'change'], 0.2)
+
+        # The same run_id in another season is a different run.
+        results_store.append_run(self.store, 2111, 'oct', [
+            {'exposure': 1040414, 'nite': 20211004, 'finished': 100,
+             'forcephoto': True, 'failures': {'RUN20': 5}},
+        ])
+        changes = results_store.regressions(self.store, (2110, 'oct'), (2111, 'oct'))
+        self.assertEqual(list(changes.index), ['RUN20'])
+        self.assertAlmostEqual(changes.loc['RUN20', 'change'], 0.05 - 0.02)
+
+    def test_throughput(self):
+        """Check the per-run rollups."""
+        df = results_store.throughput(self.store).set_index('run_id')
+        self.assertEqual(df.loc['oct', 'n_exposures'], 2)
+        self.assertEqual(df.loc['oct', 'failed'], 12)
+        self.assertEqual(df.loc['oct', 'forcephoto'], 1)
+        self.assertAlmostEqual(df.loc['oct', 'ccds_per_hour'], 50.)
+
+    def test_store_results(self):
+        """Check that fetchJobSubStats.py stores a run with its wall time."""
+        jobsub_out = os.path.join(self.tmpdir, 'jobsub_1040414.out')
+        open(jobsub_out, 'w').close()
+        os.utime(jobsub_out, (1000., 1000.))
+
+        ccd_dir = '/pnfs/des/persistent/gw/exp/20211004/1040414/dp2111/1040414_{}/'
+        files_finished = [ccd_dir.format(ccd) + 'out.tar.gz' for ccd in range(1, 41)]
+        files_failed = [ccd_dir.format(ccd) + 'RUN04_diff.FAIL' for ccd in range(1, 5)]
+        results = [{'exposure': '1040414', 'nite': '20211004', 'finished': 40,
+                    'forcephoto': False,
+                    'failures': fetchJobSubStats.count_failures(files_finished, files_failed)}]
+        # The wall time of an untracked run is unknown.
+        fetchJobSubStats.store_results(self.store, '2111', 'dec', results, run_dir=self.tmpdir)
+        df = results_store.throughput(self.store, seasons=[2111]).set_index('run_id')
+        self.assertEqual(df.loc['dec', 'failed'], 4)
+        self.assertTrue(pd.isna(df.loc['dec', 'ccds_per_hour']))
+
+        # A tracked run ends with its last job.
+        with open(os.path.join(self.tmpdir, 'job_timeline.csv'), 'w') as f:
+            f.write('time,exposure,jobid,state\n'
+                    '1060.0,1040414,111.0@jobsub01.fnal.gov,IDLE\n'
+                    '8200.0,1040414,111.0@jobsub01.fnal.gov,DONE\n')
+        fetchJobSubStats.store_results(self.store, '2112', 'dec', results, run_dir=self.tmpdir)
+        df = results_store.throughput(self.store, seasons=[2112]).set_index('run_id')
+        self.assertAlmostEqual(df.loc['dec', 'wall_time'], 7200.)
+        self.assertAlmostEqual(df.loc['dec', 'ccds_per_hour'], 20.)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Unit tests for template_precheck.py"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.append('..')
+import configure_dag
+import template_precheck
+
+
+class TestTemplatePrecheck(unittest.TestCase):
+    """Validate template_precheck.py functionalities."""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        columns = ['expnum', 'nite', 'mjd_obs', 'radeg', 'decdeg', 'band', 'teff', 'SEARCH']
+        self.exposure_df = pd.DataFrame([
+            # Search exposures.
+            [1000, 20211004, 59492.3, 10.0, -30.0, 'g', 0.9, True],
+            [1001, 20211004, 59492.4, 200.0, 10.0, 'r', 0.9, True],
+            [1002, 20211004, 59492.5, 359.9, -5.0, 'i', 0.9, True],
+            # A good template for 1000.
+            [900, 20200101, 58849.1, 10.5, -30.2, 'g', 0.8, False],
+            # Rejected for 1000: band, teff, footprint, and twindow.
+            [901, 20200101, 58849.1, 10.0, -30.0, 'r', 0.8, False],
+            [902, 20200101, 58849.1, 10.0, -30.0, 'g', 0.1, False],
+            [903, 20200101, 58849.1, 20.0, -30.0, 'g', 0.8, False],
+            [904, 20211005, 59493.3, 10.0, -30.0, 'g', 0.8, False],
+            # A template for 1002 across RA=0.
+            [905, 20200101, 58849.1, 0.3, -5.0, 'i', 0.8, False],
+        ], columns=columns)
+        self.rcfile = os.path.join(self.tmpdir, 'dagmaker.rc')
+        configure_dag.write_dag_rc(self.exposure_df, 2111, self.rcfile)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_dag_rc(self):
+        """Check that the rules written by write_dag_rc are read back."""
+        rules = template_precheck.TemplateRules.from_rc(
+            template_precheck.read_dag_rc(self.rcfile))
+        time_info = configure_dag._get_time_boundaries(self.exposure_df)
+        self.assertEqual(rules.min_nite, time_info.min_nite)
+        self.assertEqual(rules.max_nite, time_info.max_nite)
+        self.assertAlmostEqual(rules.twindow, time_info.twindow)
+        self.assertEqual(rules.teff_cuts['g'], 0.3)
+
+    def test_predict_templates(self):
+        """Check template counts and coverage for each search exposure."""
+        exp_table = os.path.join(self.tmpdir, 'exposures.csv')
+        self.exposure_df.to_csv(exp_table, index=False)
+        coverage = template_precheck.precheck(
+            exp_table, ['1000', '1001', '1002'], self.rcfile).set_index('expnum')
+
+        self.assertEqual(coverage.loc[1000, 'templates'], [900])
+        self.assertEqual(coverage.loc[1001, 'n_templates'], 0)
+        self.assertEqual(coverage.loc[1001, 'coverage'], 0.)
+        self.assertEqual(coverage.loc[1002, 'templates'], [905])
+        self.assertTrue(0. < coverage.loc[1000, 'coverage'] < 1.)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+"""Unit tests for track_jobs.py"""
+
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.append('..')
+import track_jobs
+
+
+FAKE_JOBSUB_Q = """#!{python}
+import json
+import re
+import sys
+
+# Print the queue rows for the requested jobs, as listed in queue.json. The
+# node jobs are listed under 'nodes' as [jobid, DAGManJobId, QDate, JobStatus].
+with open({queue!r}) as f:
+    queue = json.load(f)
+with open({calls!r}, 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\\n')
+if '--jobid' in sys.argv:
+    print('JOBSUBJOBID                           OWNER           SUBMITTED     RUN_TIME   ST PRI SIZE CMD')
+    for jobid in sys.argv[sys.argv.index('--jobid') + 1].split(','):
+        if jobid in queue and jobid != 'nodes':
+            print(jobid + '   desgw   10/19 10:00   0+00:01:02 ' + queue[jobid] + '   0   0.0 dagman')
+else:
+    clusters = re.findall(r'DAGManJobId == (\\d+)', sys.argv[sys.argv.index('-constraint') + 1])
+    for node in queue.get('nodes', []):
+        if node[1] in clusters:
+            print(' '.join(node))
+"""
+
+
+class TestTrackJobs(unittest.TestCase):
+    """Validate track_jobs.py functionalities."""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.queue = os.path.join(self.tmpdir, 'queue.json')
+        self.calls = os.path.join(self.tmpdir, 'calls.txt')
+        self.timeline = os.path.join(self.tmpdir, 'timeline.csv')
+
+        # Write a local fake jobsub_q.
+        self.jobsub_q = os.path.join(self.tmpdir, 'jobsub_q')
+        with open(self.jobsub_q, 'w') as f:
+            f.write(FAKE_JOBSUB_Q.format(
+                python=sys.executable, queue=self.queue, calls=self.calls))
+        os.chmod(self.jobsub_q, os.stat(self.jobsub_q).st_mode | stat.S_IEXEC)
+
+        # Write two submission outputs.
+        for exp, jobid in [('1040414', '111.0'), ('1040416', '222.0')]:
+            outfile = os.path.join(self.tmpdir, f'jobsub_{exp}.out')
+            with open(outfile, 'w') as f:
+                f.write(f"Submitting....\n"
+                        f"JobsubJobId of first job: {jobid}@jobsub01.fnal.gov\n"
+                        f"Use job id {jobid}@jobsub01.fnal.gov to retrieve output\n")
+        self.jobs = track_jobs.collect_jobs(
+            os.path.join(self.tmpdir, 'jobsub_*.out'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _set_queue(self, queue: dict):
+        with open(self.queue, 'w') as f:
+            json.dump(queue, f)
+
+    def _poll(self, **kwargs):
+        return track_jobs.poll(
+            self.jobs, self.timeline, jobsub_q=[self.jobsub_q], **kwargs)
+
+    def test_collect_jobs(self):
+        """Check that each job ID is found once and mapped to its exposure."""
+        self.assertEqual(self.jobs, {
+            '111.0@jobsub01.fnal.gov': '1040414',
+            '222.0@jobsub01.fnal.gov': '1040416',
+        })
+
+    def test_query_states_batches(self):
+        """Check that the jobs are queried in batches and missing jobs are DONE."""
+        self._set_queue({'111.0@jobsub01.fnal.gov': 'R'})
+        states = track_jobs.query_states(
+            list(self.jobs), jobsub_q=[self.jobsub_q], batch_size=2)
+        self.assertEqual(states['111.0@jobsub01.fnal.gov'], 'RUNNING')
+        self.assertEqual(states['222.0@jobsub01.fnal.gov'], track_jobs.DONE)
+        with open(self.calls) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    def test_poll_timeline(self):
+        """Check transitions, backoff, and the derived durations."""
+        queues = iter([
+            {'111.0@jobsub01.fnal.gov': 'I', '222.0@jobsub01.fnal.gov': 'I'},
+            {'111.0@jobsub01.fnal.gov': 'I', '222.0@jobsub01.fnal.gov': 'I'},
+            {'111.0@jobsub01.fnal.gov': 'R', '222.0@jobsub01.fnal.gov': 'R'},
+            {'222.0@jobsub01.fnal.gov': 'R'},
+            {},
+        ])
+        now = [0.]
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+            self._set_queue(next(queues))
+
+        self._set_queue(next(queues))
+        states = self._poll(min_interval=10., max_interval=15., backoff=2.,
+                            clock=lambda: now[0], sleep=sleep)
+        self.assertTrue(track_jobs.is_done(states))
+        self.assertEqual(waits, [10., 15., 10., 10.])
+
+        timeline = track_jobs.read_timeline(self.timeline)
+        self.assertEqual(len(timeline), 6)
+
+        durations = track_jobs.get_durations(self.timeline)
+        self.assertEqual(durations.loc['111.0@jobsub01.fnal.gov', 'queue_wait'], 25.)
+        self.assertEqual(durations.loc['111.0@jobsub01.fnal.gov', 'run_time'], 10.)
+        self.assertEqual(durations.loc['222.0@jobsub01.fnal.gov', 'run_time'], 20.)
+
+    def test_poll_resumes(self):
+        """Check that a second poll only records new transitions."""
+        self._set_queue({'111.0@jobsub01.fnal.gov': 'R'})
+        states = self._poll(max_polls=1)
+        self.assertFalse(track_jobs.is_done(states))
+        self._poll(max_polls=1)
+        self.assertEqual(len(track_jobs.read_timeline(self.timeline)), 2)
+
+    def test_poll_nodes(self):
+        """Check that the node jobs of each DAG are tracked from their submission."""
+        queues = iter([
+            {'111.0@jobsub01.fnal.gov': 'R', '222.0@jobsub01.fnal.gov': 'R',
+             'nodes': [['333.0', '111', '40', '1']]},
+            {'111.0@jobsub01.fnal.gov': 'R', '222.0@jobsub01.fnal.gov': 'R',
+             'nodes': [['333.0', '111', '40', '2']]},
+            {'222.0@jobsub01.fnal.gov': 'R'},
+            {},
+        ])
+        now = [100.]
+
+        def sleep(seconds):
+            now[0] += seconds
+            self._set_queue(next(queues))
+
+        self._set_queue(next(queues))
+        submitted = {jobid: 0. for jobid in self.jobs}
+        states = self._poll(min_interval=10., clock=lambda: now[0], sleep=sleep,
+                            submitted=submitted)
+        self.assertTrue(track_jobs.is_done(states))
+        self.assertNotIn('333.0@jobsub01.fnal.gov', states)
+
+        durations = track_jobs.get_durations(self.timeline)
+        node = durations.loc['333.0@jobsub01.fnal.gov']
+        self.assertEqual(node['kind'], 'node')
+        self.assertEqual(node['exposure'], '1040414')
+        self.assertEqual(node['queue_wait'], 70.)
+        self.assertEqual(node['run_time'], 10.)
+        self.assertEqual(durations.loc['111.0@jobsub01.fnal.gov', 'kind'], 'dag')
+        self.assertEqual(durations.loc['111.0@jobsub01.fnal.gov', 'queue_wait'], 100.)
+
+    def test_submit_times(self):
+        """Check that the DAGs are submitted when their outputs were written."""
+        os.utime(os.path.join(self.tmpdir, 'jobsub_1040414.out'), (1000., 1000.))
+        times = track_jobs.submit_times(os.path.join(self.tmpdir, 'jobsub_*.out'))
+        self.assertEqual(times['111.0@jobsub01.fnal.gov'], 1000.)
+
+    def test_poll_failures(self):
+        """Check that polling stops when jobsub_q keeps failing."""
+        waits = []
+        for jobsub_q in [['false'], [os.path.join(self.tmpdir, 'missing_jobsub_q')]]:
+            states = track_jobs.poll(
+                self.jobs, self.timeline, jobsub_q=jobsub_q, max_failures=3,
+                sleep=waits.append)
+            self.assertEqual(states, {jobid: None for jobid in self.jobs})
+        self.assertEqual(len(waits), 4)
+        self.assertEqual(len(track_jobs.read_timeline(self.timeline)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Unit tests for triage_failures.py"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('..')
+import triage_failures
+
+
+class TestTriageFailures(unittest.TestCase):
+    """Validate triage_failures.py functionalities."""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.prefix = self.tmpdir + '/'
+
+        # Lay out .FAIL markers and logs as they appear in /pnfs.
+        layout = {
+            'g_01': ('RUN04_diff.FAIL', '', 'makeWSTemplates: no templates found\n'),
+            'g_03': ('RUN04_diff.FAIL', '', 'Job exceeded expected-lifetime\n'),
+            'g_04': ('RUN20_combine.FAIL', 'MemoryError\n', ''),
+            'g_05': ('RUN24_db.FAIL', '', 'psycopg2.OperationalError: could not connect to server\n'),
+            'g_06': ('RUN04_diff.FAIL', '', 'all good\nTotal wall time: 00:12:31\n'),
+        }
+        for ccd, (fail, fail_text, log_text) in layout.items():
+            ccd_dir = os.path.join(self.tmpdir, '20211004', '1040414', 'dp2111', ccd)
+            os.makedirs(ccd_dir)
+            with open(os.path.join(ccd_dir, fail), 'w') as f:
+                f.write(fail_text)
+            with open(os.path.join(ccd_dir, 'SEdiff.log'), 'w') as f:
+                f.write(log_text)
+        self.fail_files = triage_failures.find_fail_files(
+            ['1040414'], ['20211004'], '2111', prefix=self.prefix)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_bounded(self):
+        """Check that only the tail of a large log is read."""
+        log = os.path.join(self.tmpdir, 'big.log')
+        with open(log, 'w') as f:
+            f.write('x' * 10000 + 'No space left on device')
+        text = triage_failures.read_bounded(log, max_bytes=100)
+        self.assertEqual(len(text), 100)
+        self.assertEqual(triage_failures.classify(text), 'disk_full')
+        self.assertEqual(triage_failures.read_bounded('does/not/exist'), '')
+
+    def test_classify(self):
+        """Check that kills by the batch system are not taken for OOM."""
+        self.assertEqual(triage_failures.classify('Job killed: exceeded expected-lifetime'), 'timeout')
+        self.assertEqual(triage_failures.classify(
+            'Job was removed: killed by SYSTEM_PERIODIC_REMOVE after wall time limit exceeded'),
+            'timeout')
+        self.assertEqual(triage_failures.classify('Running SWarp\nKilled\n'), 'oom')
+        self.assertEqual(triage_failures.classify('skilled worker killed the job'), 'unknown')
+
+    def test_triage(self):
+        """Check the cause and step of each failure and the summary."""
+        failures = triage_failures.triage(self.fail_files, workers=4)
+        causes = dict(zip(failures['ccd'], failures['cause']))
+        self.assertEqual(causes, {
+            'g_01': 'missing_template',
+            'g_03': 'timeout',
+            'g_04': 'oom',
+            'g_05': 'db_write',
+            'g_06': 'unknown',
+        })
+        self.assertTrue((failures['exposure'] == '1040414').all())
+
+        counts, examples = triage_failures.summarize(failures, examples=1)
+        self.assertEqual(counts.loc['RUN04_diff', 'timeout'], 1)
+        self.assertEqual(counts.loc['RUN04_diff'].sum(), 3)
+        self.assertEqual(len(examples['unknown']), 1)
+
+    def test_triage_dagmaker_fallback(self):
+        """Check that the DAGMaker output only decides otherwise unknown causes."""
+        with open(os.path.join(self.tmpdir, 'dagmaker_1040414.out'), 'w') as f:
+            f.write('ccd 12: no templates found\n')
+        failures = triage_failures.triage(self.fail_files, workers=4, run_dir=self.tmpdir)
+        causes = dict(zip(failures['ccd'], failures['cause']))
+        self.assertEqual(causes['g_03'], 'timeout')
+        self.assertEqual(causes['g_04'], 'oom')
+        self.assertEqual(causes['g_06'], 'missing_template')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""Unit tests for validate_dag.py"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('..')
+import configure_dag
+import template_precheck
+import validate_dag
+
+
+def _write_dag(path: str, num_ccds: int = 3, num_templates: int = 1,
+               se_memory: str = '3600MB', extra: str = ''):
+    """Write a DAG with SE jobs for the search and template CCDs and one
+    diffimg job per CCD depending on them."""
+    lines = ['# Generated for testing.']
+    for ccd in range(1, num_ccds + 1):
+        for exp in range(num_templates + 1):
+            lines.append(f'JOB SE_{exp}_{ccd} SE.sub')
+            lines.append(f'VARS SE_{exp}_{ccd} request_memory="{se_memory}" ccd="{ccd}"')
+        lines.append(f'JOB DIFFIMG_{ccd} diffimg.sub')
+        lines.append(f'VARS DIFFIMG_{ccd} request_memory="2500MB" request_disk="70GB"')
+        lines.append(f'RETRY DIFFIMG_{ccd} 2')
+        parents = ' '.join(f'SE_{exp}_{ccd}' for exp in range(num_templates + 1))
+        lines.append(f'PARENT {parents} CHILD DIFFIMG_{ccd}')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n' + extra)
+
+
+class TestValidateDAG(unittest.TestCase):
+    """Validate validate_dag.py functionalities."""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dag = os.path.join(self.tmpdir, 'good.dag')
+        _write_dag(self.dag)
+
+        rcfile = os.path.join(self.tmpdir, 'dagmaker.rc')
+        exposure_df = configure_dag.pd.DataFrame(
+            {'mjd_obs': [59492.3, 59492.4], 'SEARCH': ['True', 'True']})
+        configure_dag.write_dag_rc(exposure_df, 2111, rcfile)
+        self.rc = template_precheck.read_dag_rc(rcfile)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_dag(self):
+        """Check the compact graph of a good DAG."""
+        graph = validate_dag.parse_dag(self.dag)
+        self.assertEqual(graph.errors, [])
+        self.assertEqual(graph.count('se'), 6)
+        self.assertEqual(graph.count('diffimg'), 3)
+        self.assertEqual(graph.retries['DIFFIMG_1'], 2)
+        self.assertEqual(graph.vars['SE_0_2']['ccd'], '2')
+        self.assertEqual(graph.children[graph.names['SE_1_1']], [graph.names['DIFFIMG_1']])
+        self.assertEqual(validate_dag.validate_dag(self.dag, 3, 1, self.rc), [])
+
+    def test_bad_dags(self):
+        """Check that cycles, bad counts, and bad resources are reported."""
+        cycle = os.path.join(self.tmpdir, 'cycle.dag')
+        _write_dag(cycle, extra='PARENT DIFFIMG_1 CHILD SE_0_1\n')
+        self.assertIn('the DAG has a cycle', validate_dag.validate_dag(cycle))
+
+        undefined = os.path.join(self.tmpdir, 'undefined.dag')
+        _write_dag(undefined, extra='PARENT DIFFIMG_1 CHILD CLEANUP\n')
+        self.assertEqual(len(validate_dag.validate_dag(undefined)), 1)
+
+        errors = validate_dag.validate_dag(self.dag, num_ccds=7, num_templates=1)
+        self.assertEqual(errors, ["6 SE nodes for 7 CCDs"])
+        # DAGMaker may find more templates than predicted, which is only a warning.
+        with self.assertLogs(level='WARNING') as logs:
+            errors = validate_dag.validate_dag(self.dag, num_ccds=3, num_templates=0)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(logs.records), 2)
+
+        memory = os.path.join(self.tmpdir, 'memory.dag')
+        _write_dag(memory, se_memory='2GB')
+        errors = validate_dag.validate_dag(memory, rc=self.rc)
+        self.assertEqual(len(errors), 6)
+
+    def test_validate_dags(self):
+        """Check that many DAGs are validated in parallel."""
+        bad = os.path.join(self.tmpdir, 'bad.dag')
+        _write_dag(bad, num_ccds=1)
+        results = validate_dag.validate_dags(
+            [self.dag, bad, os.path.join(self.tmpdir, 'missing.dag')],
+            num_ccds=3, num_templates={self.dag: 1, bad: 1}, rc=self.rc, workers=2,
+            min_parallel=2)
+        self.assertEqual(results[self.dag], [])
+        self.assertEqual(len(results[bad]), 1)
+        self.assertEqual(len(results[os.path.join(self.tmpdir, 'missing.dag')]), 1)
+
+        # A few DAGs are validated in this process with the same results.
+        serial = validate_dag.validate_dags(
+            list(results), num_ccds=3, num_templates={self.dag: 1, bad: 1}, rc=self.rc)
+        self.assertEqual(serial, results)
+
+    def test_get_dag_file(self):
+        cmd = 'jobsub_submit_dag -G des --role=DESGW file://desgw_pipeline_1040414.dag'
+        self.assertEqual(validate_dag.get_dag_file(cmd), 'desgw_pipeline_1040414.dag')
+        self.assertIsNone(validate_dag.get_dag_file('ERROR: no dag'))
+
+
+if __name__ == "__main__":
+    unittest.main()
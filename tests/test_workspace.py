@@ -0,0 +1,98 @@
+"""Unit tests for workspace.py"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append('..')
+import workspace
+
+
+class TestWorkspace(unittest.TestCase):
+    """Validate workspace.py functionalities."""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.environ.pop(workspace.LOCK_ENV, None)
+
+    def tearDown(self):
+        os.environ.pop(workspace.LOCK_ENV, None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_create(self):
+        """Check that new run directories never collide."""
+        base = os.path.join(self.tmpdir, 'runs')
+        paths = {workspace.RunWorkspace.create(base, name='2111').path for _ in range(5)}
+        self.assertEqual(len(paths), 5)
+        self.assertTrue(all(os.path.basename(p).startswith('2111_') for p in paths))
+
+    def test_lock(self):
+        """Check that a run directory can only be locked once."""
+        ws = workspace.RunWorkspace(self.tmpdir)
+        with ws.lock():
+            self.assertTrue(os.path.exists(ws.file(workspace.LOCK_FILE)))
+            # A child process inherits the lock.
+            workspace.RunWorkspace(self.tmpdir).acquire()
+
+            os.environ.pop(workspace.LOCK_ENV)
+            with self.assertRaises(workspace.WorkspaceLockedError):
+                workspace.RunWorkspace(self.tmpdir).acquire()
+        self.assertFalse(os.path.exists(ws.file(workspace.LOCK_FILE)))
+
+    def test_stale_lock(self):
+        """Check that a lock left by a dead process is taken over."""
+        process = subprocess.Popen(['true'])
+        process.wait()
+        ws = workspace.RunWorkspace(self.tmpdir)
+        with open(ws.file(workspace.LOCK_FILE), 'w') as f:
+            f.write(f"{workspace.socket.gethostname()} {process.pid}\n")
+        with ws.lock():
+            with open(ws.file(workspace.LOCK_FILE)) as f:
+                self.assertEqual(f.read().split()[1], str(os.getpid()))
+
+    def test_stale_lock_race(self):
+        """Check that a lock taken over by another process is put back."""
+        ws = workspace.RunWorkspace(self.tmpdir)
+        with ws.lock():
+            os.environ.pop(workspace.LOCK_ENV)
+            # The lock looked stale, but was taken over before it was renamed.
+            with mock.patch.object(workspace.RunWorkspace, '_is_stale',
+                                   side_effect=[True, False]):
+                with self.assertRaises(workspace.WorkspaceLockedError):
+                    workspace.RunWorkspace(self.tmpdir).acquire()
+            with open(ws.file(workspace.LOCK_FILE)) as f:
+                self.assertEqual(f.read().split()[1], str(os.getpid()))
+            self.assertEqual(os.listdir(self.tmpdir), [workspace.LOCK_FILE])
+
+    def test_atomic_write(self):
+        """Check that a failed write leaves the old file untouched."""
+        ws = workspace.RunWorkspace(self.tmpdir)
+        ws.write('dagmaker.rc', 'SEASON=2111\n')
+        with self.assertRaises(ValueError):
+            with workspace.atomic_open(ws.file('dagmaker.rc')) as f:
+                f.write('SEASON=')
+                raise ValueError
+        with open(ws.file('dagmaker.rc')) as f:
+            self.assertEqual(f.read(), 'SEASON=2111\n')
+        self.assertEqual(os.listdir(self.tmpdir), ['dagmaker.rc'])
+
+    def test_atomic_write_mode(self):
+        """Check that written files get the same mode as with open()."""
+        ws = workspace.RunWorkspace(self.tmpdir)
+        with open(ws.file('plain.txt'), 'w') as f:
+            f.write('plain')
+        ws.write('atomic.txt', 'atomic')
+        self.assertEqual(os.stat(ws.file('atomic.txt')).st_mode,
+                         os.stat(ws.file('plain.txt')).st_mode)
+
+        # Rewriting a file keeps its mode.
+        os.chmod(ws.file('atomic.txt'), 0o640)
+        ws.write('atomic.txt', 'again')
+        self.assertEqual(os.stat(ws.file('atomic.txt')).st_mode & 0o7777, 0o640)
+
+
+if __name__ == "__main__":
+    unittest.main()
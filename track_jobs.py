@@ -0,0 +1,393 @@
+"""A module to track submitted DAGs through the jobsub queue.
+
+run_gw_workflow.py leaves one jobsub_<exp>.out file per submitted exposure.
+The functions in this script turn those files into a job-completion timeline:
+    (1) Extract the DAGMan job IDs from the submission outputs, then
+    (2) Poll jobsub_q for all tracked DAGs and for the node jobs they have
+        submitted in batched queries, backing off while nothing changes, and
+    (3) Append every state transition to a timeline file, from which the
+        queue-wait and run-time distributions are computed. Waits count from
+        submission: the jobsub_<exp>.out mtime for a DAG and the QDate of a
+        node job.
+"""
+
+import argparse
+import csv
+import glob
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+import utils
+import workspace
+
+
+JOBID_PATTERN = re.compile(r'\b(\d+\.\d+@[\w.-]+)')
+QUEUE_LINE_PATTERN = re.compile(
+    r'^(\d+\.\d+@[\w.-]+)\s+\S+\s+\S+\s+\S+\s+\S+\s+([A-Z])\b')
+# Node job lines of the DAGManJobId query: JobId DAGManJobId QDate JobStatus.
+NODE_LINE_PATTERN = re.compile(r'^(\d+\.\d+)\s+(\d+)\s+(\d+)\s+(\d+)$')
+
+# jobsub_q status codes, plus DONE for jobs that have left the queue.
+STATES = {
+    'I': 'IDLE',
+    'R': 'RUNNING',
+    'H': 'HELD',
+    'C': 'COMPLETED',
+    'X': 'REMOVED',
+}
+DONE = 'DONE'
+TERMINAL_STATES = {'COMPLETED', 'REMOVED', DONE}
+# HTCondor JobStatus codes of the node jobs.
+NODE_STATES = {
+    '1': 'IDLE',
+    '2': 'RUNNING',
+    '3': 'REMOVED',
+    '4': 'COMPLETED',
+    '5': 'HELD',
+    '6': 'RUNNING',
+    '7': 'HELD',
+}
+# dag is the jobid of the DAGMan job itself for DAG rows, and of the parent
+# DAGMan job for node rows.
+TIMELINE_COLUMNS = ['time', 'exposure', 'jobid', 'dag', 'state', 'submitted']
+
+
+### Main functions.
+
+def get_job_ids(jobsub_out: str) -> list:
+    """Extract the job IDs from a jobsub_submit_dag output file.
+
+    Args:
+      jobsub_out (str): Path to a jobsub_<exp>.out file.
+
+    Returns:
+      The unique job IDs in the order they appear in the file.
+    """
+    with open(jobsub_out) as f:
+        ids = JOBID_PATTERN.findall(f.read())
+    return list(dict.fromkeys(ids))
+
+
+@utils.log_start_and_finish
+def collect_jobs(pattern: str = 'jobsub_*.out') -> dict:
+    """Map every tracked job ID to the exposure it was submitted for.
+
+    Args:
+      pattern (str, default='jobsub_*.out'): Glob for the submission outputs.
+        The exposure (or coadd set) is the part of the filename after
+        'jobsub_'.
+
+    Returns:
+      A dict of {jobid: exposure}.
+    """
+    jobs = {}
+    for jobsub_out in sorted(glob.glob(pattern)):
+        name = os.path.basename(jobsub_out)
+        exposure = name[len('jobsub_'):-len('.out')]
+        ids = get_job_ids(jobsub_out)
+        if len(ids) == 0:
+            logging.warning(f"No job ID found in {jobsub_out}.")
+        for jobid in ids:
+            jobs[jobid] = exposure
+    logging.info(f"Tracking {len(jobs)} jobs.")
+    return jobs
+
+
+def submit_times(pattern: str = 'jobsub_*.out') -> dict:
+    """Map every tracked job ID to the mtime of its submission output."""
+    times = {}
+    for jobsub_out in glob.glob(pattern):
+        for jobid in get_job_ids(jobsub_out):
+            times[jobid] = os.path.getmtime(jobsub_out)
+    return times
+
+
+def _run_query(cmd: list) -> str:
+    """Run a jobsub_q query, returning its output or None if it failed."""
+    try:
+        process = subprocess.run(
+            cmd, universal_newlines=True, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+    except OSError as err:
+        logging.warning(f"jobsub_q could not be run: {err}")
+        return None
+    if process.returncode != 0:
+        logging.warning(f"jobsub_q failed: {process.stdout.strip()}")
+        return None
+    return process.stdout
+
+
+def query_states(
+  jobids: list, jobsub_q: list = ['jobsub_q', '-G', 'des'],
+  batch_size: int = 200) -> dict:
+    """Query jobsub_q for the state of many jobs with few calls.
+
+    The job IDs are passed to jobsub_q in comma-separated batches, so one call
+    covers up to batch_size jobs. Jobs which do not appear in the output have
+    left the queue and are reported as DONE. Jobs in a batch whose query
+    fails are left out of the result.
+
+    Args:
+      jobids (list): The job IDs to query.
+      jobsub_q (list): The jobsub_q command, without the --jobid argument.
+      batch_size (int, default=200): Maximum number of job IDs per call.
+
+    Returns:
+      A dict of {jobid: state}.
+    """
+    states = {jobid: DONE for jobid in jobids}
+    for start in range(0, len(jobids), batch_size):
+        batch = jobids[start:start + batch_size]
+        stdout = _run_query(jobsub_q + ['--jobid', ','.join(batch)])
+        if stdout is None:
+            # Don't mark anything DONE on a failed query.
+            for jobid in batch:
+                states.pop(jobid)
+            continue
+        for line in stdout.splitlines():
+            match = QUEUE_LINE_PATTERN.match(line.strip())
+            if match is not None and match.group(1) in states:
+                states[match.group(1)] = STATES.get(match.group(2), match.group(2))
+    return states
+
+
+def query_nodes(
+  dag_jobids: list, jobsub_q: list = ['jobsub_q', '-G', 'des'],
+  batch_size: int = 200) -> tuple:
+    """Query jobsub_q for the node jobs submitted by many DAGs.
+
+    The DAGs are grouped by schedd, and the node jobs of up to batch_size
+    DAGs are found in one call with a DAGManJobId constraint, which jobsub_q
+    passes on to condor_q.
+
+    Args:
+      dag_jobids (list): The job IDs of the DAGMan jobs.
+      jobsub_q (list): The jobsub_q command, without the query arguments.
+      batch_size (int, default=200): Maximum number of DAGs per call.
+
+    Returns:
+      A dict of {node jobid: (DAG jobid, submit time, state)} for the node
+      jobs in the queue, and the set of DAG jobids whose query succeeded.
+    """
+    clusters = {}
+    for jobid in dag_jobids:
+        cluster, schedd = jobid.split('@', 1)
+        clusters.setdefault(schedd, []).append(cluster.split('.')[0])
+
+    nodes = {}
+    queried = set()
+    for schedd, schedd_clusters in clusters.items():
+        for start in range(0, len(schedd_clusters), batch_size):
+            batch = schedd_clusters[start:start + batch_size]
+            constraint = ' || '.join(f'DAGManJobId == {cluster}' for cluster in batch)
+            stdout = _run_query(jobsub_q + [
+                '-name', schedd, '-constraint', constraint,
+                '-af:j', 'DAGManJobId', 'QDate', 'JobStatus'])
+            if stdout is None:
+                continue
+            queried.update(f'{cluster}.0@{schedd}' for cluster in batch)
+            for line in stdout.splitlines():
+                match = NODE_LINE_PATTERN.match(line.strip())
+                if match is not None:
+                    nodes[f'{match.group(1)}@{schedd}'] = (
+                        f'{match.group(2)}.0@{schedd}', float(match.group(3)),
+                        NODE_STATES.get(match.group(4), match.group(4)))
+    return nodes, queried
+
+
+def append_timeline(records: list, timeline: str):
+    """Append state transitions to the timeline file.
+
+    Args:
+      records (list): Lists of [time, exposure, jobid, dag, state, submitted].
+      timeline (str): Path to the timeline CSV file.
+    """
+    new_file = not os.path.exists(timeline)
+    with open(timeline, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(TIMELINE_COLUMNS)
+        writer.writerows(records)
+
+
+def read_timeline(timeline: str) -> pd.DataFrame:
+    """Load the timeline file, or an empty timeline if it does not exist."""
+    if not os.path.exists(timeline):
+        return pd.DataFrame(columns=TIMELINE_COLUMNS)
+    df = pd.read_csv(timeline, dtype={'exposure': str}).reindex(columns=TIMELINE_COLUMNS)
+    # Timelines from before node jobs were tracked only hold DAGs.
+    df['dag'] = df['dag'].fillna(df['jobid'])
+    return df
+
+
+def last_states(timeline: str) -> dict:
+    """Get the most recent recorded state of every job in the timeline."""
+    df = read_timeline(timeline)
+    return dict(zip(df['jobid'], df['state']))
+
+
+def _node_dags(timeline: str) -> dict:
+    """Map every node job in the timeline to its DAG."""
+    df = read_timeline(timeline)
+    df = df[df['jobid'] != df['dag']]
+    return dict(zip(df['jobid'], df['dag']))
+
+
+@utils.log_start_and_finish
+def poll(
+  jobs: dict, timeline: str = 'job_timeline.csv',
+  jobsub_q: list = ['jobsub_q', '-G', 'des'], batch_size: int = 200,
+  min_interval: float = 60., max_interval: float = 900.,
+  backoff: float = 2., max_polls: int = None, max_failures: int = 5,
+  submitted: dict = None,
+  clock: callable = time.time, sleep: callable = time.sleep) -> dict:
+    """Poll the tracked DAGs and their node jobs until the DAGs have all
+    left the queue.
+
+    The wait between polls starts at min_interval and is multiplied by
+    backoff after every poll that sees no transitions, up to max_interval.
+    Any transition resets the wait to min_interval. Polling resumes from the
+    states already recorded in the timeline. Polling stops with an error
+    after max_failures polls in a row in which every query failed. A node
+    job that has left the queue is recorded as DONE once the query for its
+    DAG succeeds without it.
+
+    Args:
+      jobs (dict): A dict of {jobid: exposure}, as made by collect_jobs.
+      timeline (str, default='job_timeline.csv'): Path to the timeline file.
+      jobsub_q (list): The jobsub_q command, without the --jobid argument.
+      batch_size (int, default=200): Maximum number of job IDs per query.
+      min_interval (float, default=60.): Shortest wait between polls [s].
+      max_interval (float, default=900.): Longest wait between polls [s].
+      backoff (float, default=2.): Growth factor of the wait between polls.
+      max_polls (int, default=None): Stop after this many polls.
+      max_failures (int, default=5): Stop after this many failed polls in a row.
+      submitted (dict, default=None): {jobid: submit time} of the DAGs, as
+        made by submit_times.
+      clock (callable): Returns the current time in seconds.
+      sleep (callable): Waits for a given number of seconds.
+
+    Returns:
+      A dict of {jobid: state} with the latest known states of the DAGs.
+    """
+    submitted = submitted or {}
+    states = last_states(timeline)
+    node_dags = _node_dags(timeline)
+    interval = min_interval
+    num_polls = 0
+    num_failures = 0
+    while True:
+        active = [j for j in jobs if states.get(j) not in TERMINAL_STATES]
+        if len(active) == 0 or (max_polls is not None and num_polls >= max_polls):
+            break
+        if num_polls > 0:
+            sleep(interval)
+
+        now = clock()
+        records = []
+        queried = query_states(active, jobsub_q, batch_size)
+        for jobid, state in queried.items():
+            if states.get(jobid) != state:
+                records.append([now, jobs[jobid], jobid, jobid, state, submitted.get(jobid)])
+                states[jobid] = state
+
+        nodes, queried_dags = query_nodes(active, jobsub_q, batch_size)
+        for node, (dag, submit_time, state) in nodes.items():
+            if dag in jobs and states.get(node) != state:
+                records.append([now, jobs[dag], node, dag, state, submit_time])
+                states[node] = state
+                node_dags[node] = dag
+        for node, dag in node_dags.items():
+            if (dag in queried_dags and node not in nodes
+                    and states.get(node) not in TERMINAL_STATES):
+                records.append([now, jobs[dag], node, dag, DONE, None])
+                states[node] = DONE
+        append_timeline(records, timeline)
+        num_polls += 1
+
+        num_failures = num_failures + 1 if len(queried) == 0 else 0
+        if num_failures >= max_failures:
+            logging.error(f"jobsub_q failed {num_failures} times in a row, "
+                          f"stopping with {len(active)} jobs still active.")
+            break
+
+        if len(records) > 0:
+            logging.info(f"{len(records)} state transitions.")
+            interval = min_interval
+        else:
+            interval = min(interval * backoff, max_interval)
+
+    return {jobid: states.get(jobid) for jobid in jobs}
+
+
+def is_done(states: dict) -> bool:
+    """Check whether every tracked job has reached a terminal state."""
+    return all(state in TERMINAL_STATES for state in states.values())
+
+
+@utils.log_start_and_finish
+def get_durations(timeline: str = 'job_timeline.csv') -> pd.DataFrame:
+    """Compute the queue wait and run time of every job in the timeline.
+
+    The queue wait is the time from the submission of a job (or its first
+    record, if the submit time is unknown) until it first starts RUNNING, and
+    the run time is the time from then until it reaches a terminal state.
+    Jobs that have not reached a stage have NaN durations.
+
+    Args:
+      timeline (str, default='job_timeline.csv'): Path to the timeline file.
+
+    Returns:
+      A DataFrame indexed by jobid with exposure, kind ('dag' or 'node'),
+      queue_wait, and run_time.
+    """
+    df = read_timeline(timeline)
+    first_seen = df.groupby('jobid')['time'].min()
+    submitted = pd.to_numeric(df['submitted']).groupby(df['jobid']).min().fillna(first_seen)
+    started = df[df['state'] == 'RUNNING'].groupby('jobid')['time'].min()
+    ended = df[df['state'].isin(TERMINAL_STATES)].groupby('jobid')['time'].min()
+
+    durations = pd.DataFrame(index=first_seen.index)
+    durations['exposure'] = df.groupby('jobid')['exposure'].first()
+    dags = df.groupby('jobid')['dag'].first()
+    durations['kind'] = (dags == dags.index).map({True: 'dag', False: 'node'})
+    durations['queue_wait'] = started - submitted
+    durations['run_time'] = ended - started
+    return durations
+
+
+### Runtime behavior.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pattern', type=str, default='jobsub_*.out',
+                        help="glob for the jobsub submission outputs, in the run directory.")
+    parser.add_argument('--timeline', type=str, default='job_timeline.csv')
+    parser.add_argument('--batch_size', type=int, default=200)
+    parser.add_argument('--min_interval', type=float, default=60.)
+    parser.add_argument('--max_interval', type=float, default=900.)
+    parser.add_argument('--once', action='store_true',
+                        help="poll once and exit 0 only if all jobs are done.")
+    workspace.add_arguments(parser)
+    args = parser.parse_args()
+    ws = workspace.from_args(args)
+
+    utils._setup_logging(ws.file('track_jobs.log'))
+
+    jobs = collect_jobs(ws.file(args.pattern))
+    states = poll(jobs, ws.file(args.timeline), batch_size=args.batch_size,
+                  min_interval=args.min_interval,
+                  max_interval=args.max_interval,
+                  max_polls=1 if args.once else None,
+                  submitted=submit_times(ws.file(args.pattern)))
+
+    print(pd.Series(states, dtype=object).value_counts().to_string())
+    print(get_durations(ws.file(args.timeline)).groupby('kind')[['queue_wait', 'run_time']].describe().T)
+
+    if args.once:
+        sys.exit(0 if is_done(states) else 1)
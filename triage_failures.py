@@ -0,0 +1,187 @@
+"""A module to classify the .FAIL markers left by the SEDiff jobs.
+
+fetchJobSubStats.py counts failures per step from the .FAIL filenames alone.
+The functions in this script also look at why each job failed:
+    (1) Find the .FAIL markers for a list of exposures, then
+    (2) Read each marker and the tails of the logs next to it (and the
+        DAGMaker output for the exposure) in parallel, never reading more
+        than a fixed number of bytes from any file, and
+    (3) Classify each failure with a precompiled rule set and count the
+        failures per step and cause, keeping a few example paths per cause.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import os
+import re
+
+import pandas as pd
+
+import utils
+import workspace
+
+
+DIR_PREFIX_EXP = '/pnfs/des/persistent/gw/exp/'
+LOG_PATTERNS = ['*.log', '*.out', '*.err']
+MAX_BYTES = 64 * 1024
+
+# Checked in order, so put the most specific causes first.
+RULES = [
+    ('missing_template', re.compile(
+        r'NO TEMPLATE IMAGES|no templates? (?:found|available)', re.I)),
+    # Job logs print their wall time on success too, so only match overruns.
+    ('timeout', re.compile(
+        r'\btimed out\b|\bTimeoutError\b|expected-lifetime'
+        r'|wall ?(?:clock )?time (?:limit )?(?:exceeded|reached)'
+        r'|exceeded (?:the )?(?:\w+ )?(?:lifetime|wall ?time)', re.I)),
+    # Removals by the batch system also say "killed", so only match the kernel
+    # OOM killer's bare "Killed" line and SIGKILL, after the timeouts.
+    ('oom', re.compile(
+        r'MemoryError|out of memory|bad_alloc|memory usage exceeded|oom-kill'
+        r'|(?m-i:^Killed$)|killed by signal 9', re.I)),
+    ('disk_full', re.compile(
+        r'No space left on device|Disk quota exceeded', re.I)),
+    ('db_write', re.compile(
+        r'psycopg2|cx_Oracle|ORA-\d+|OperationalError|could not connect to (?:server|database)'
+        r'|database (?:error|write)', re.I)),
+    ('missing_input', re.compile(
+        r'No such file or directory|FileNotFoundError|ifdh (?:cp )?fail', re.I)),
+]
+UNKNOWN = 'unknown'
+
+
+### Main functions.
+
+def read_bounded(path: str, max_bytes: int = MAX_BYTES, tail: bool = True) -> str:
+    """Read at most max_bytes from the end (or start) of a file.
+
+    Args:
+      path (str): The file to read.
+      max_bytes (int, default=MAX_BYTES): The most bytes to read.
+      tail (bool, default=True): Read the end of the file instead of the start.
+
+    Returns:
+      The decoded text, or an empty string if the file cannot be read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if tail:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(f.tell() - max_bytes, 0))
+            data = f.read(max_bytes)
+    except OSError:
+        return ''
+    return data.decode('utf-8', errors='replace')
+
+
+def classify(text: str, rules: list = RULES) -> str:
+    """Return the first cause whose rule matches the text."""
+    for cause, pattern in rules:
+        if pattern.search(text):
+            return cause
+    return UNKNOWN
+
+
+def find_fail_files(
+  exps: list, nites: list, season: str, prefix: str = DIR_PREFIX_EXP) -> list:
+    """Find the .FAIL markers for the exposures, as fetchJobSubStats.py does."""
+    fail_files = []
+    for exp, nite in zip(exps, nites):
+        fail_files += glob.glob(f"{prefix}{nite}/{exp}/dp{season}/*_*/*.FAIL")
+    return fail_files
+
+
+def triage_one(fail_file: str, max_bytes: int = MAX_BYTES, run_dir: str = '.') -> dict:
+    """Classify a single failure from its marker and nearby logs.
+
+    The marker and the files matching LOG_PATTERNS in its CCD directory are
+    classified first. dagmaker_<exp>.out in the run directory covers the
+    whole exposure, so it is only used when the CCD's own files give no
+    cause.
+
+    Returns:
+      A dict with path, exposure, ccd, step, and cause.
+    """
+    ccd_dir = os.path.dirname(fail_file)
+    exposure = ccd_dir.split('/')[-3] if ccd_dir.count('/') >= 3 else ''
+    logs = []
+    for pattern in LOG_PATTERNS:
+        logs += sorted(glob.glob(os.path.join(ccd_dir, pattern)))
+
+    text = '\n'.join([read_bounded(fail_file, max_bytes, tail=False)]
+                     + [read_bounded(log, max_bytes) for log in logs])
+    cause = classify(text)
+    if cause == UNKNOWN:
+        cause = classify(read_bounded(
+            os.path.join(run_dir, f"dagmaker_{exposure}.out"), max_bytes))
+    return {
+        'path': fail_file,
+        'exposure': exposure,
+        'ccd': os.path.basename(ccd_dir),
+        'step': os.path.basename(fail_file).split('.')[0],
+        'cause': cause,
+    }
+
+
+@utils.log_start_and_finish
+def triage(
+  fail_files: list, workers: int = 16,
+  max_bytes: int = MAX_BYTES, run_dir: str = '.') -> pd.DataFrame:
+    """Classify many failures in parallel.
+
+    Args:
+      fail_files (list): Paths to .FAIL markers.
+      workers (int, default=16): Number of reader threads.
+      max_bytes (int, default=MAX_BYTES): The most bytes read from any file.
+      run_dir (str, default='.'): Directory holding the DAGMaker outputs.
+
+    Returns:
+      A DataFrame with one row per failure, as returned by triage_one.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(lambda f: triage_one(f, max_bytes, run_dir), fail_files))
+    return pd.DataFrame(rows, columns=['path', 'exposure', 'ccd', 'step', 'cause'])
+
+
+def summarize(failures: pd.DataFrame, examples: int = 3) -> tuple:
+    """Count the failures per step and cause.
+
+    Args:
+      failures (pd.DataFrame): Output of triage.
+      examples (int, default=3): Number of example paths kept per cause.
+
+    Returns:
+      A DataFrame of counts with steps as rows and causes as columns, and a
+      dict of {cause: [example paths]}.
+    """
+    counts = pd.crosstab(failures['step'], failures['cause'])
+    example_paths = {cause: group['path'].head(examples).tolist()
+                     for cause, group in failures.groupby('cause')}
+    return counts, example_paths
+
+
+### Runtime behavior.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--season', type=str)
+    parser.add_argument('--exp_table', type=str, default='exp_list_full.list',
+                        help="exposure/nite table from get_full_exp_info.py, in the run directory.")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--examples', type=int, default=3)
+    workspace.add_arguments(parser)
+    args = parser.parse_args()
+    ws = workspace.from_args(args)
+
+    exp_details = pd.read_csv(ws.file(args.exp_table))
+    fail_files = find_fail_files(
+        exp_details['exposure'], exp_details['nite'], args.season)
+    print(f"Found {len(fail_files)} .FAIL files.")
+
+    failures = triage(fail_files, args.workers, run_dir=ws.path)
+    counts, example_paths = summarize(failures, args.examples)
+    print(counts.to_string())
+    for cause, paths in example_paths.items():
+        print(cause + ':')
+        for path in paths:
+            print('    ' + path)
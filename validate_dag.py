@@ -0,0 +1,322 @@
+"""A module to validate the .dag files written by DAGMaker.
+
+run_gw_workflow.py only checks that DAGMaker printed a jobsub_submit_dag
+command. The functions in this script check the DAG itself before it is
+submitted:
+    (1) Stream-parse the JOB, SPLICE, SUBDAG, PARENT/CHILD, VARS, and RETRY
+        lines into a compact graph, then
+    (2) Check that every referenced node is defined and the graph is acyclic,
+    (3) Check the number of SE and diffimg nodes against the CCDs and
+        templates of the exposure, and
+    (4) Check the resources requested in VARS against dagmaker.rc.
+Many DAGs are validated in parallel with validate_dags.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import logging
+import re
+import shlex
+
+import template_precheck
+import utils
+
+
+# DECam CCDs 1-62, without the dead CCDs 2 and 61.
+DECAM_CCDS = [ccd for ccd in range(1, 63) if ccd not in (2, 61)]
+
+# Node kinds, matched against the node name.
+NODE_KINDS = [
+    ('se', re.compile(r'^SE(?:[_-]|$)', re.I)),
+    ('diffimg', re.compile(r'^DIFF(?:IMG)?(?:[_-]|$)', re.I)),
+]
+
+# jobsub option -> DAG variable holding the same request.
+RESOURCE_VARS = {
+    'memory': 'request_memory',
+    'disk': 'request_disk',
+    'cpu': 'request_cpus',
+}
+# Below this many DAGs, starting processes costs more than validating them.
+PARALLEL_MIN_DAGS = 32
+UNITS_MB = {'': 1., 'KB': 1. / 1024., 'MB': 1., 'GB': 1024., 'TB': 1024. ** 2}
+VARS_PATTERN = re.compile(r'(\w+)\s*=\s*"((?:[^"\\]|\\.)*)"')
+
+
+@dataclass
+class DagGraph:
+    names: dict = field(default_factory=dict)
+    kinds: list = field(default_factory=list)
+    children: list = field(default_factory=list)
+    vars: dict = field(default_factory=dict)
+    retries: dict = field(default_factory=dict)
+    errors: list = field(default_factory=list)
+
+    def add_node(self, name: str, kind: str, lineno: int) -> int:
+        """Add a node, recording an error if it is already defined."""
+        if name in self.names:
+            self.errors.append(f"line {lineno}: node {name} defined twice")
+            return self.names[name]
+        self.names[name] = len(self.kinds)
+        self.kinds.append(kind)
+        self.children.append([])
+        return self.names[name]
+
+    def count(self, kind: str) -> int:
+        return self.kinds.count(kind)
+
+
+def _node_kind(name: str) -> str:
+    for kind, pattern in NODE_KINDS:
+        if pattern.match(name):
+            return kind
+    return 'other'
+
+
+### Main functions.
+
+def parse_dag(dag_file: str) -> DagGraph:
+    """Parse a .dag file into a DagGraph one line at a time.
+
+    Edges are stored as child lists of node indices. References to undefined
+    nodes are checked once the whole file has been read, since DAGMan allows
+    PARENT/CHILD lines before the JOB lines.
+
+    Args:
+      dag_file (str): Path to the .dag file.
+
+    Returns:
+      The parsed DagGraph, with any syntax errors in its errors attribute.
+    """
+    graph = DagGraph()
+    edges = []
+    node_lines = []
+    with open(dag_file) as f:
+        for lineno, line in enumerate(f, 1):
+            tokens = line.split()
+            if len(tokens) == 0 or tokens[0].startswith('#'):
+                continue
+            keyword = tokens[0].upper()
+
+            if keyword in ('JOB', 'SPLICE', 'FINAL') and len(tokens) >= 3:
+                kind = 'splice' if keyword == 'SPLICE' else _node_kind(tokens[1])
+                graph.add_node(tokens[1], kind, lineno)
+            elif keyword == 'SUBDAG' and len(tokens) >= 4:
+                graph.add_node(tokens[2], 'subdag', lineno)
+            elif keyword == 'PARENT':
+                upper = [t.upper() for t in tokens]
+                if 'CHILD' not in upper:
+                    graph.errors.append(f"line {lineno}: PARENT without CHILD")
+                    continue
+                split = upper.index('CHILD')
+                edges.append((lineno, tokens[1:split], tokens[split + 1:]))
+            elif keyword == 'VARS' and len(tokens) >= 2:
+                node_lines.append((lineno, tokens[1]))
+                graph.vars.setdefault(tokens[1], {}).update(
+                    VARS_PATTERN.findall(line.split(None, 2)[2] if len(tokens) > 2 else ''))
+            elif keyword == 'RETRY' and len(tokens) >= 3:
+                node_lines.append((lineno, tokens[1]))
+                graph.retries[tokens[1]] = int(tokens[2])
+
+    for lineno, parents, children in edges:
+        ids = []
+        for names in (parents, children):
+            ids.append([graph.names[n] for n in names if n in graph.names])
+            node_lines += [(lineno, n) for n in names]
+        for parent in ids[0]:
+            graph.children[parent].extend(ids[1])
+    for lineno, name in node_lines:
+        if name not in graph.names and name != 'ALL_NODES':
+            graph.errors.append(f"line {lineno}: undefined node {name}")
+    return graph
+
+
+def is_acyclic(graph: DagGraph) -> bool:
+    """Check that the graph has no cycles with Kahn's algorithm."""
+    indegree = [0] * len(graph.kinds)
+    for children in graph.children:
+        for child in children:
+            indegree[child] += 1
+    ready = [node for node, degree in enumerate(indegree) if degree == 0]
+    visited = 0
+    while ready:
+        node = ready.pop()
+        visited += 1
+        for child in graph.children[node]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                ready.append(child)
+    return visited == len(graph.kinds)
+
+
+def _to_mb(value: str) -> float:
+    """Convert a size such as 2500MB or 2.5GB to MB."""
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?B?)\s*', value, re.I)
+    if match is None:
+        raise ValueError(f"Cannot parse size {value}.")
+    unit = match.group(2).upper()
+    unit = unit + 'B' if unit in ('K', 'M', 'G', 'T') else unit
+    return float(match.group(1)) * UNITS_MB[unit]
+
+
+def get_resources(jobsub_opts: str) -> dict:
+    """Get the requested resources from a JOBSUB_OPTS string.
+
+    Returns:
+      A dict of {DAG variable: value}, with sizes in MB.
+    """
+    resources = {}
+    for option in shlex.split(jobsub_opts):
+        key, _, value = option.lstrip('-').partition('=')
+        if key in RESOURCE_VARS and value:
+            resources[RESOURCE_VARS[key]] = float(value) if key == 'cpu' else _to_mb(value)
+    return resources
+
+
+def check_resources(graph: DagGraph, rc: dict) -> list:
+    """Compare the resources requested in VARS with dagmaker.rc.
+
+    SE nodes are checked against JOBSUB_OPTS_SE and all other nodes against
+    JOBSUB_OPTS. Only resources that appear in a node's VARS are checked.
+
+    Args:
+      graph (DagGraph): The parsed DAG.
+      rc (dict): The contents of dagmaker.rc, from template_precheck.read_dag_rc.
+
+    Returns:
+      A list of error messages.
+    """
+    expected = {
+        'se': get_resources(rc.get('JOBSUB_OPTS_SE', rc.get('JOBSUB_OPTS', ''))),
+        'other': get_resources(rc.get('JOBSUB_OPTS', '')),
+    }
+    common = graph.vars.get('ALL_NODES', {})
+    errors = []
+    for name, node in graph.names.items():
+        wanted = expected['se' if graph.kinds[node] == 'se' else 'other']
+        node_vars = {**common, **graph.vars.get(name, {})}
+        for var, value in wanted.items():
+            if var not in node_vars:
+                continue
+            try:
+                requested = (float(node_vars[var]) if var == 'request_cpus'
+                             else _to_mb(node_vars[var]))
+            except ValueError:
+                errors.append(f"node {name}: cannot parse {var}={node_vars[var]}")
+                continue
+            if abs(requested - value) > 1e-6:
+                errors.append(f"node {name}: {var}={node_vars[var]} does not match dagmaker.rc")
+    return errors
+
+
+@utils.log_start_and_finish
+def validate_dag(
+  dag_file: str, num_ccds: int = None, num_templates: int = None,
+  rc: dict = None) -> list:
+    """Validate a single .dag file.
+
+    Args:
+      dag_file (str): Path to the .dag file.
+      num_ccds (int, default=None): Number of CCDs of the search exposure.
+        The node counts are only checked if this is given.
+      num_templates (int, default=None): Number of template exposures
+        predicted by template_precheck. DAGMaker searches the whole database
+        and may find more, so node counts that do not match the prediction
+        are only logged as warnings.
+      rc (dict, default=None): The contents of dagmaker.rc. The resources
+        are only checked if this is given.
+
+    Returns:
+      A list of error messages; the DAG is valid if it is empty.
+    """
+    warnings = []
+    try:
+        graph = parse_dag(dag_file)
+    except (OSError, ValueError) as err:
+        return [f"cannot read {dag_file}: {err}"]
+    errors = list(graph.errors)
+
+    if len(graph.kinds) == 0:
+        errors.append("no nodes")
+    if not is_acyclic(graph):
+        errors.append("the DAG has a cycle")
+
+    if num_ccds is not None:
+        num_se, num_diffimg = graph.count('se'), graph.count('diffimg')
+        if num_se < num_ccds:
+            errors.append(f"{num_se} SE nodes for {num_ccds} CCDs")
+        if num_templates is not None:
+            if num_se > num_ccds * (1 + num_templates):
+                warnings.append(f"{num_se} SE nodes for {num_ccds} CCDs and "
+                                f"{num_templates} predicted templates")
+            expected_diffimg = num_ccds if num_templates > 0 else 0
+            if num_diffimg != expected_diffimg:
+                warnings.append(f"{num_diffimg} diffimg nodes, expected {expected_diffimg} "
+                                f"from the predicted templates")
+
+    if rc is not None:
+        errors += check_resources(graph, rc)
+
+    for warning in warnings:
+        logging.warning(f"{dag_file}: {warning}")
+    for error in errors:
+        logging.error(f"{dag_file}: {error}")
+    return errors
+
+
+def _validate(kwargs: dict) -> list:
+    return validate_dag(**kwargs)
+
+
+@utils.log_start_and_finish
+def validate_dags(
+  dag_files: list, num_ccds: int = None, num_templates: dict = None,
+  rc: dict = None, workers: int = None,
+  min_parallel: int = PARALLEL_MIN_DAGS) -> dict:
+    """Validate many .dag files, in parallel if there are enough of them.
+
+    Args:
+      dag_files (list): Paths to the .dag files.
+      num_ccds (int, default=None): Number of CCDs per search exposure.
+      num_templates (dict, default=None): {dag_file: # of templates}.
+      rc (dict, default=None): The contents of dagmaker.rc.
+      workers (int, default=None): Number of processes.
+      min_parallel (int, default=PARALLEL_MIN_DAGS): Validate fewer DAGs
+        than this in this process.
+
+    Returns:
+      A dict of {dag_file: list of error messages}.
+    """
+    num_templates = num_templates or {}
+    jobs = [{'dag_file': dag_file, 'num_ccds': num_ccds,
+             'num_templates': num_templates.get(dag_file), 'rc': rc}
+            for dag_file in dag_files]
+    if len(jobs) < max(min_parallel, 2):
+        return {job['dag_file']: _validate(job) for job in jobs}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(dag_files, pool.map(_validate, jobs)))
+
+
+def get_dag_file(jobsub_cmd: str) -> str:
+    """Get the .dag file submitted by a jobsub_submit_dag command, or None."""
+    for token in jobsub_cmd.split():
+        if token.endswith('.dag'):
+            return token[len('file://'):] if token.startswith('file://') else token
+    return None
+
+
+### Runtime behavior.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dag_files', nargs='+')
+    parser.add_argument('--rc', type=str, default=None, help="dagmaker.rc to check resources against.")
+    parser.add_argument('--num_ccds', type=int, default=None)
+    args = parser.parse_args()
+
+    rc = template_precheck.read_dag_rc(args.rc) if args.rc is not None else None
+    results = validate_dags(args.dag_files, args.num_ccds, rc=rc)
+    for dag_file, errors in results.items():
+        print(dag_file + (': OK' if len(errors) == 0 else ':'))
+        for error in errors:
+            print('    ' + error)
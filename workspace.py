@@ -0,0 +1,199 @@
+"""Per-run workspaces so several test campaigns can share a submit node.
+
+Every script reads and writes its files (dagmaker.rc, dagmaker_<exp>.out,
+jobsub_<exp>.out, exp_list_full.list, ...) through a RunWorkspace:
+    (1) Each campaign gets its own run directory, made unique with the
+        time, pid, and a random suffix, then
+    (2) A lock file in the run directory stops two scripts from making or
+        submitting the DAGs of the same run at once, and
+    (3) Files are written atomically, to a temporary file that is renamed
+        into place, so a crash never leaves a half-written file behind.
+Without --run_dir or --new_run, the workspace is the current directory.
+"""
+
+import argparse
+import atexit
+import contextlib
+import os
+import socket
+import tempfile
+import time
+import uuid
+
+
+LOCK_FILE = '.run.lock'
+# Set while a process holds a lock, so the scripts it starts can share it.
+LOCK_ENV = 'DESGW_RUN_LOCK'
+
+
+class WorkspaceLockedError(RuntimeError):
+    """Raised when another process is using the run directory."""
+
+
+@contextlib.contextmanager
+def atomic_open(path: str, mode: str = 'w'):
+    """Open a temporary file that replaces path when the block succeeds.
+
+    The new file keeps the mode of the file it replaces, or gets the mode
+    open() would give it.
+
+    Args:
+      path (str): The file to write.
+      mode (str, default='w'): 'w' for text or 'wb' for binary.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _file_mode(path: str) -> int:
+    """Get the mode of an existing file, or the default mode for a new one."""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+class RunWorkspace:
+    """A directory holding all the files of one test campaign."""
+    def __init__(self, path: str = '.'):
+        self.path = os.path.abspath(path)
+        self._held = False
+        os.makedirs(self.path, exist_ok=True)
+
+    @classmethod
+    def create(cls, base: str = 'runs', name: str = '') -> 'RunWorkspace':
+        """Create a new, uniquely named run directory under base.
+
+        Args:
+          base (str, default='runs'): Directory holding the run directories.
+          name (str, default=''): Optional label, e.g. the season.
+        """
+        os.makedirs(base, exist_ok=True)
+        label = '_'.join(x for x in [
+            name, time.strftime('%Y%m%d_%H%M%S'), str(os.getpid()),
+            uuid.uuid4().hex[:6]] if x)
+        path = os.path.join(base, label)
+        os.makedirs(path)
+        return cls(path)
+
+    def file(self, name: str) -> str:
+        """Get the path of a file in the workspace."""
+        return os.path.join(self.path, name)
+
+    def write(self, name: str, data, mode: str = 'w'):
+        """Atomically write data to a file in the workspace."""
+        with atomic_open(self.file(name), mode) as f:
+            f.write(data)
+
+    def acquire(self):
+        """Take the lock of the workspace until release or exit.
+
+        The lock file records the host and pid of its holder. A lock left by
+        a dead process on this host is taken over. Child processes inherit
+        the lock through the DESGW_RUN_LOCK environment variable.
+
+        Raises:
+          WorkspaceLockedError if another process holds the lock.
+        """
+        lock_file = self.file(LOCK_FILE)
+        if self._held or os.environ.get(LOCK_ENV) == lock_file:
+            return
+
+        flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY
+        try:
+            fd = os.open(lock_file, flags)
+        except FileExistsError:
+            if self._is_stale(lock_file):
+                # Rename the stale lock away first, so only one process can
+                # take it over, and check that it was not taken over already.
+                stale_file = f"{lock_file}.{os.getpid()}.stale"
+                with contextlib.suppress(FileNotFoundError):
+                    os.rename(lock_file, stale_file)
+                    if not self._is_stale(stale_file):
+                        with contextlib.suppress(FileExistsError):
+                            os.link(stale_file, lock_file)
+                    os.remove(stale_file)
+            try:
+                fd = os.open(lock_file, flags)
+            except FileExistsError:
+                raise WorkspaceLockedError(
+                    f"{self.path} is in use by {self._holder(lock_file)}.") from None
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"{socket.gethostname()} {os.getpid()}\n")
+
+        self._held = True
+        os.environ[LOCK_ENV] = lock_file
+        atexit.register(self.release)
+
+    def release(self):
+        """Give up the lock if this workspace holds it."""
+        if not self._held:
+            return
+        self._held = False
+        os.environ.pop(LOCK_ENV, None)
+        atexit.unregister(self.release)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.file(LOCK_FILE))
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Hold the lock of the workspace for the duration of the block."""
+        self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    @staticmethod
+    def _holder(lock_file: str) -> str:
+        """Get the host and pid recorded in a lock file."""
+        try:
+            with open(lock_file) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return 'another process'
+
+    @staticmethod
+    def _is_stale(lock_file: str) -> bool:
+        """Check whether a lock was left by a process that no longer exists."""
+        try:
+            with open(lock_file) as f:
+                host, pid = f.read().split()
+            if host != socket.gethostname():
+                return False
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except (OSError, ValueError):
+            return False
+        return False
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Add the --run_dir and --new_run options to a script's parser."""
+    parser.add_argument('--run_dir', type=str, default=None,
+                        help="run directory to read and write files in.")
+    parser.add_argument('--new_run', action='store_true',
+                        help="create a new run directory under runs/.")
+
+
+def from_args(args: argparse.Namespace, name: str = '') -> RunWorkspace:
+    """Get the workspace chosen on the command line."""
+    if args.new_run:
+        ws = RunWorkspace.create(name=name)
+        print("Run directory: " + ws.path)
+        return ws
+    return RunWorkspace(args.run_dir or '.')